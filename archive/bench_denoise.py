@@ -0,0 +1,129 @@
+"""
+Benchmark the denoising strategies of denoise.py on the pass charts in 'Cleaned_Pass_Charts'.
+
+For every pass type that is denoised, run its detector with each strategy and report the
+mean time per chart, and how far the detected pass locations drift, in yards, from the
+locations found with the default non-local means strategy.
+
+Usage:
+	python bench_denoise.py --limit 200 --strategies nlmeans morphology median area
+"""
+
+import cv2
+import time
+import argparse
+import itertools
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from chart import Chart
+from pass_detection import incompletions, interceptions, touchdowns
+from main import get_pass_data, pass_chart_jobs
+
+DETECTORS = {
+	"INCOMPLETE": incompletions,
+	"INTERCEPTION": interceptions,
+	"TOUCHDOWN": touchdowns,
+}
+
+# strategies to compare, "nlmeans" is the reference and uses the defaults of each pass type
+STRATEGIES = {
+	"nlmeans": None,
+	"morphology": ("morphology", {}),
+	"median": ("median", {}),
+	"area": ("area", {}),
+	"none": ("none", {}),
+}
+
+def locations(df):
+	"""
+	Located (x, y) passes of a detector output, in yards.
+	"""
+	xy = df[["x", "y"]].to_numpy(dtype=float)
+	return xy[~np.isnan(xy).any(axis=1)]
+
+def drift(ref, xy):
+	"""
+	Mean and max distance in yards between the best matching of two sets of locations.
+	"""
+	if len(ref) == 0 or len(xy) == 0:
+		return np.nan, np.nan
+	d = np.hypot(ref[:, None, 0] - xy[None, :, 0], ref[:, None, 1] - xy[None, :, 1])
+	rows, cols = linear_sum_assignment(d)
+	return d[rows, cols].mean(), d[rows, cols].max()
+
+def benchmark(jobs, strategies):
+	"""
+	Function to run every detector with every strategy on the pass charts of jobs.
+
+	Input:
+		jobs: iterable of (image, data) pairs, from main.pass_chart_jobs
+		strategies: names of STRATEGIES to compare, the reference "nlmeans" is always run
+	Return:
+		stats: {(pass_type, strategy): {"time", "mean_drift", "max_drift", "count_changed", "failed"}}
+	"""
+	strategies = ["nlmeans"] + [s for s in strategies if s != "nlmeans"]
+	stats = {}
+
+	for (image, data) in jobs:
+		if image is None:
+			continue
+		bgr = cv2.imread(image)
+		(n_com, n_td, n_int, n_inc) = get_pass_data(data)
+		counts = {"INCOMPLETE": n_inc, "INTERCEPTION": n_int, "TOUCHDOWN": n_td}
+
+		for (pass_type, detector) in DETECTORS.items():
+			n = counts[pass_type]
+			if n == 0:
+				continue
+
+			ref = None
+			for name in strategies:
+				s = stats.setdefault((pass_type, name), {"time": [], "mean_drift": [],
+					"max_drift": [], "count_changed": 0, "failed": 0})
+
+				# a fresh Chart so that every strategy pays for the same color conversions
+				chart = Chart(bgr)
+				start = time.perf_counter()
+				try:
+					df = detector(chart, n, STRATEGIES[name])
+				except Exception:
+					s["failed"] += 1
+					continue
+				s["time"].append(time.perf_counter() - start)
+
+				xy = locations(df)
+				if name == "nlmeans":
+					ref = xy
+				if ref is None:
+					continue
+				(mean_drift, max_drift) = drift(ref, xy)
+				s["mean_drift"].append(mean_drift)
+				s["max_drift"].append(max_drift)
+				s["count_changed"] += int(len(xy) != len(ref))
+
+	return stats
+
+def report(stats):
+	print("%-13s %-11s %7s %10s %12s %12s %9s %7s" % ("pass_type", "strategy", "charts",
+		"ms/chart", "mean drift", "max drift", "changed", "failed"))
+	for (pass_type, name) in sorted(stats):
+		s = stats[(pass_type, name)]
+		ms = 1000*np.mean(s["time"]) if s["time"] else np.nan
+		mean_drift = np.nanmean(s["mean_drift"]) if s["mean_drift"] else np.nan
+		max_drift = np.nanmax(s["max_drift"]) if s["max_drift"] else np.nan
+		print("%-13s %-11s %7d %10.1f %12.3f %12.3f %9d %7d" % (pass_type, name, len(s["time"]),
+			ms, mean_drift, max_drift, s["count_changed"], s["failed"]))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Benchmark the denoising strategies of the detectors')
+	parser.add_argument('-p', '--path', type=str, dest='path', default="Cleaned_Pass_Charts",
+		help='folder of cleaned pass charts')
+	parser.add_argument('-n', '--limit', type=int, dest='limit', default=None,
+		help='number of charts to benchmark')
+	parser.add_argument('-s', '--strategies', nargs='+', type=str, dest='strategies',
+		default=list(STRATEGIES), choices=list(STRATEGIES), help='strategies to compare')
+	args = parser.parse_args()
+
+	jobs = itertools.islice(pass_chart_jobs(args.path), args.limit)
+	report(benchmark(jobs, args.strategies))
@@ -0,0 +1,173 @@
+"""
+End to end benchmark of the pass chart pipeline on synthetic pass charts from synthetic.py.
+
+Every chart goes through the same stages as scrape.py, clean.py and main.py, in memory:
+decoding the downloaded JPEG, cleaning the field, saving and re-reading the cleaned JPEG,
+and each of the four detectors. The benchmark reports the charts per second of every stage,
+the peak memory of the process, and the error of the detected pass locations against the
+known locations, in yards.
+
+With --scale, the detectors also run on the full resolution charts, and the benchmark fails
+if any pass located on the reduced charts is more than --tolerance yards from its location on
+the full resolution chart, or isn't located at all.
+
+Usage:
+	python bench_pipeline.py --charts 50 --seed 0
+	python bench_pipeline.py --charts 50 --scale 2 --tolerance 0.1
+"""
+
+import sys
+
+import cv2
+import time
+import resource
+import argparse
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from synthetic import make_chart
+from undistort_field import clean_field
+from pass_detection import completions, incompletions, interceptions, touchdowns
+from chart import Chart
+
+DETECTORS = [
+	("COMPLETE", completions),
+	("TOUCHDOWN", touchdowns),
+	("INTERCEPTION", interceptions),
+	("INCOMPLETE", incompletions),
+]
+
+def match_errors(truth, found):
+	"""
+	Function to match detected pass locations to the true ones.
+
+	Input:
+		truth: numpy.ndarray of true (x, y) locations in yards
+		found: numpy.ndarray of detected (x, y) locations in yards, NaN if not located
+	Return:
+		errors: distance in yards of every matched pass
+		n_missed: number of true passes without a matching detection
+	"""
+	found = found[~np.isnan(found).any(axis=1)]
+	if len(truth) == 0 or len(found) == 0:
+		return np.zeros(0), len(truth)
+	d = np.hypot(truth[:, None, 0] - found[None, :, 0], truth[:, None, 1] - found[None, :, 1])
+	rows, cols = linear_sum_assignment(d)
+	return d[rows, cols], len(truth) - len(rows)
+
+def run_chart(seed, timings, errors, missed, layout=None, scale=1, drifts=None):
+	"""
+	Function to generate one chart and time every stage of the pipeline on it. If scale > 1 
+	and drifts is given, the distance in yards of every pass from its location on the full
+	resolution chart is appended to drifts[pass_type], inf if it is only located on one.
+	"""
+	image, data, truth = make_chart(seed, layout)
+	raw = cv2.imencode(".jpeg", image)[1]
+
+	def stage(name, fn, *args):
+		start = time.perf_counter()
+		result = fn(*args)
+		timings.setdefault(name, []).append(time.perf_counter() - start)
+		return result
+
+	img = stage("decode", cv2.imdecode, raw, cv2.IMREAD_COLOR)
+	clean_img = stage("clean", clean_field, img[0:680, 0:1200])
+	if clean_img is None:
+		missed["UNDISTORT"] = missed.get("UNDISTORT", 0) + 1
+		return
+	saved = stage("save", lambda: cv2.imdecode(cv2.imencode(".jpeg", clean_img,
+		[cv2.IMWRITE_JPEG_QUALITY, 75])[1], cv2.IMREAD_COLOR))
+	full = Chart(saved)
+	chart = stage("reduce", full.reduced, scale) if scale > 1 else full
+
+	for (pass_type, detector) in DETECTORS:
+		true_xy = truth.loc[truth["pass_type"] == pass_type, ["x", "y"]].to_numpy()
+		if len(true_xy) == 0:
+			continue
+		try:
+			df = stage(pass_type, detector, chart, len(true_xy))
+		except Exception:
+			missed[pass_type] = missed.get(pass_type, 0) + len(true_xy)
+			continue
+		(e, n_missed) = match_errors(true_xy, df[["x", "y"]].to_numpy(dtype=float))
+		errors.setdefault(pass_type, []).extend(e)
+		missed[pass_type] = missed.get(pass_type, 0) + n_missed
+
+		if (scale > 1) and (drifts is not None):
+			reference = detector(full, len(true_xy))[["x", "y"]].to_numpy(dtype=float)
+			reduced = df[["x", "y"]].to_numpy(dtype=float)
+			located = ~np.isnan(reference).any(axis=1)
+			(d, n_lost) = match_errors(reference[located], reduced)
+			n_extra = (~np.isnan(reduced).any(axis=1)).sum() - len(d)
+			drifts.setdefault(pass_type, []).extend(list(d) + [np.inf]*(n_lost + n_extra))
+
+def report(n_charts, timings, errors, missed):
+	print("%-13s %10s %12s" % ("stage", "ms/chart", "charts/sec"))
+	total = 0.0
+	for (name, t) in timings.items():
+		total += np.sum(t)
+		print("%-13s %10.1f %12.1f" % (name, 1000*np.mean(t), len(t)/np.sum(t)))
+	print("%-13s %10.1f %12.1f" % ("total", 1000*total/n_charts, n_charts/total))
+
+	# ru_maxrss is in kilobytes on Linux
+	print("\npeak memory: %.1f MB" % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0))
+
+	print("\n%-13s %8s %10s %10s %10s %8s" % ("pass_type", "passes", "mean err", "median",
+		"p95", "missed"))
+	for (pass_type, detector) in DETECTORS:
+		e = np.asarray(errors.get(pass_type, []))
+		if len(e) == 0 and missed.get(pass_type, 0) == 0:
+			continue
+		stats = (np.mean(e), np.median(e), np.percentile(e, 95)) if len(e) else (np.nan,)*3
+		print("%-13s %8d %10.3f %10.3f %10.3f %8d" % ((pass_type, len(e)) + stats +
+			(missed.get(pass_type, 0),)))
+	if missed.get("UNDISTORT"):
+		print("\n%d charts could not be undistorted" % missed["UNDISTORT"])
+
+def report_drift(drifts, scale, tolerance):
+	"""
+	Function to print the distances of the passes on reduced charts from their locations on
+	the full resolution charts.
+
+	Return:
+		ok: True if every pass is within tolerance yards of its full resolution location
+	"""
+	print("\n%-13s %8s %10s %10s %8s   (scale %d vs full resolution)" % ("pass_type",
+		"passes", "mean yd", "max yd", "over", scale))
+	ok = True
+	for (pass_type, detector) in DETECTORS:
+		d = np.asarray(drifts.get(pass_type, []))
+		if len(d) == 0:
+			continue
+		over = (d > tolerance).sum()
+		ok = ok and (over == 0)
+		finite = d[np.isfinite(d)]
+		mean = np.mean(finite) if len(finite) else np.nan
+		print("%-13s %8d %10.3f %10.3f %8d" % (pass_type, len(d), mean, d.max(), over))
+	if ok:
+		print("\nOK: every pass is within %.2f yards of its full resolution location" % tolerance)
+	else:
+		print("\nFAILED: passes are more than %.2f yards from their full resolution location, "
+			"or lost" % tolerance)
+	return ok
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Benchmark the pipeline on synthetic pass charts')
+	parser.add_argument('-n', '--charts', type=int, dest='charts', default=50,
+		help='number of synthetic charts')
+	parser.add_argument('-s', '--seed', type=int, dest='seed', default=0,
+		help='seed of the first chart')
+	parser.add_argument('-l', '--layout', type=int, dest='layout', default=None, choices=[50, 70],
+		help='layout of the charts, both if not given')
+	parser.add_argument('--scale', type=int, dest='scale', default=1,
+		help='detect on the charts reduced by this factor, refining on the full charts')
+	parser.add_argument('--tolerance', type=float, dest='tolerance', default=0.1,
+		help='maximum distance in yards of a pass found with --scale from its full resolution location')
+	args = parser.parse_args()
+
+	timings, errors, missed, drifts = {}, {}, {}, {}
+	for i in range(args.charts):
+		run_chart(args.seed + i, timings, errors, missed, args.layout, args.scale, drifts)
+	report(args.charts, timings, errors, missed)
+	if args.scale > 1 and not report_drift(drifts, args.scale, args.tolerance):
+		sys.exit(1)
@@ -0,0 +1,64 @@
+"""
+Benchmark of the start up time of the modules that scripts and worker processes import.
+
+Every module is imported in a fresh Python interpreter, several times, and the benchmark
+reports the median import time and which heavy dependencies the import loaded. Heavy
+dependencies are imported by the functions that need them, so they should only show up for
+modules that use them at module level, such as pandas for main.py.
+
+Usage:
+	python bench_startup.py --repeat 5
+"""
+
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+MODULES = ["instrument", "undistort_field", "chart", "pass_detection", "clean", "extract", "main",
+	"pipeline"]
+
+HEAVY = ["pandas", "sklearn", "scipy", "skimage", "PIL", "bs4", "requests"]
+
+# run in the fresh interpreter, prints the import time and the heavy modules loaded
+_SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+import %s
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, [m for m in %r if m in sys.modules]]))
+"""
+
+
+def import_time(module):
+	"""
+	Function to import module in a fresh interpreter.
+
+	Return:
+		seconds: time of the import
+		loaded: heavy dependencies that the import loaded
+	"""
+	out = subprocess.run([sys.executable, "-c", _SCRIPT % (module, HEAVY)],
+		stdout=subprocess.PIPE, check=True).stdout
+	seconds, loaded = json.loads(out.decode().strip().splitlines()[-1])
+	return seconds, loaded
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Benchmark the import time of the modules')
+	parser.add_argument('-r', '--repeat', type=int, dest='repeat', default=5,
+		help='number of imports of each module')
+	parser.add_argument('-m', '--modules', nargs='+', type=str, dest='modules', default=MODULES,
+		help='modules to import')
+	args = parser.parse_args()
+
+	print("%-16s %10s  %s" % ("module", "median ms", "heavy dependencies loaded"))
+	for module in args.modules:
+		try:
+			runs = [import_time(module) for i in range(args.repeat)]
+		except subprocess.CalledProcessError:
+			print("%-16s %10s" % (module, "failed"))
+			continue
+		print("%-16s %10.1f  %s" % (module, 1000*statistics.median([s for (s, loaded) in runs]),
+			", ".join(runs[0][1]) or "-"))
@@ -0,0 +1,110 @@
+"""
+Persistent cache of the pass locations extracted from each chart. Entries are keyed by the
+hash of the cleaned image, the chart data and the version of the detectors, so a chart is
+only extracted again if it is new, it changed, or the detectors changed. The cache is kept
+under a maximum size by evicting the least recently used entries.
+"""
+
+import os
+import pickle
+import hashlib
+
+
+class ResultCache(object):
+	"""
+	Content addressed cache of extraction results on disk.
+
+	The object only holds its settings, so it can be passed to worker processes, which read
+	and write entries concurrently. Eviction should be run by a single process.
+
+	Input:
+		path: folder of the cache, created if it doesn't exist
+		max_bytes: maximum total size of the cache
+	"""
+
+	def __init__(self, path, max_bytes=1024**3):
+		self.path = path
+		self.max_bytes = max_bytes
+		os.makedirs(path, exist_ok=True)
+
+	def key(self, version, *files):
+		"""
+		Function to get the cache key of the contents of files with the detectors at version.
+
+		Input:
+			version: version tag of the detectors, pass_detection.DETECTOR_VERSION
+			files: paths of the files the result depends on, e.g. the image and its data
+		Return:
+			key: hex SHA-256 of the version and the contents of the files
+		"""
+		h = hashlib.sha256(version.encode("utf-8"))
+		for f in files:
+			with open(f, "rb") as _file:
+				content = _file.read()
+			h.update(str(len(content)).encode("utf-8") + b":")
+			h.update(content)
+		return h.hexdigest()
+
+	def _entry(self, key):
+		return os.path.join(self.path, key[:2], key + ".pkl")
+
+	def get(self, key):
+		"""
+		Return the cached result of key, or None if there is none.
+		"""
+		entry = self._entry(key)
+		try:
+			with open(entry, "rb") as _file:
+				result = pickle.load(_file)
+		except (OSError, EOFError, pickle.UnpicklingError):
+			return None
+
+		# mark the entry as recently used
+		try:
+			os.utime(entry)
+		except OSError:
+			pass
+		return result
+
+	def put(self, key, result):
+		"""
+		Store result under key.
+		"""
+		entry = self._entry(key)
+		os.makedirs(os.path.dirname(entry), exist_ok=True)
+		temp = entry + ".%d.tmp" % os.getpid()
+		with open(temp, "wb") as _file:
+			pickle.dump(result, _file, protocol=pickle.HIGHEST_PROTOCOL)
+		os.replace(temp, entry)
+
+	def evict(self):
+		"""
+		Delete the least recently used entries until the cache fits in max_bytes.
+
+		Return:
+			n_evicted: number of entries deleted
+		"""
+		entries = []
+		total = 0
+		for (folder, _, files) in os.walk(self.path):
+			for f in files:
+				if not f.endswith(".pkl"):
+					continue
+				try:
+					stat = os.stat(os.path.join(folder, f))
+				except OSError:
+					continue
+				entries.append((stat.st_mtime, stat.st_size, os.path.join(folder, f)))
+				total += stat.st_size
+
+		n_evicted = 0
+		for (mtime, size, entry) in sorted(entries):
+			if total <= self.max_bytes:
+				break
+			try:
+				os.remove(entry)
+			except OSError:
+				continue
+			total -= size
+			n_evicted += 1
+		return n_evicted
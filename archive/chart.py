@@ -0,0 +1,212 @@
+"""
+A cleaned pass chart image that is decoded once and shared by all of the detectors
+in pass_detection.py. The BGR, HSV and RGB views of the image, and the color mask of
+each pass type, are computed the first time they are asked for and then cached.
+
+A chart can also be reduced by an integer factor, so that the detectors of incompletions
+and interceptions mask, denoise and cluster a smaller image. The centers they find are then
+refined on the full resolution image, in a small window around each center. Completions and
+touchdowns are always found on the full resolution image, see full_resolution().
+"""
+
+import io
+import cv2
+import numpy as np
+import instrument
+
+
+# half size in full resolution pixels of the window a reduced center is refined in, which
+# covers a pass marker, plus the reduction factor
+REFINE_RADIUS = 10
+
+# color ranges of each pass type, as (color space, lower, upper)
+COLOR_RANGES = {
+    "COMPLETE": ("hsv", np.array([40, 100, 100]), np.array([80, 255, 255])),
+    "INCOMPLETE": ("bgr", np.array([230, 230, 230]), np.array([255, 255, 255])),
+    "INTERCEPTION": ("bgr", np.array([0, 0, 150]), np.array([30, 30, 255])),
+    "TOUCHDOWN": ("td_hsv", np.array([20, 100, 100]), np.array([30, 255, 255])),
+}
+
+
+class Chart(object):
+    """
+    Decoded image of a pass chart from the folder 'Cleaned_Pass_Charts'.
+
+    Input:
+        bgr: numpy.ndarray of the image, in BGR order as returned by cv2.imread
+    """
+
+    def __init__(self, bgr):
+        self.bgr = bgr
+        self.row, self.col = bgr.shape[0:2]
+        # reduction factor of bgr, and the full resolution chart if it is reduced
+        self.scale = 1
+        self.full = None
+        self._views = {}
+        self._masks = {}
+
+    @classmethod
+    def read(cls, image):
+        """
+        Decode the image at the file path image.
+        """
+        return cls(cv2.imread(image))
+
+    def reduced(self, scale):
+        """
+        Function to get the chart reduced by an integer factor, for faster detection. row and
+        col of the reduced chart are those of the full chart, since they select the layout.
+
+        Input:
+            scale: reduction factor, 1 for the chart itself
+        Return:
+            chart: reduced Chart, whose refine() maps centers back to this chart
+        """
+        if scale == 1:
+            return self
+        small = Chart(cv2.resize(self.bgr, (self.col//scale, self.row//scale),
+            interpolation=cv2.INTER_AREA))
+        small.row, small.col = self.row, self.col
+        small.scale = scale
+        small.full = self
+        return small
+
+    def full_resolution(self):
+        """
+        The full resolution chart of a reduced chart, or the chart itself. Detectors whose
+        markers can't be found on a reduced chart and refined, such as the thin strokes of
+        touchdowns, run on it.
+        """
+        return self if self.full is None else self.full
+
+    def _view(self, name, convert):
+        if name not in self._views:
+            self._views[name] = convert()
+        return self._views[name]
+
+    @property
+    def hsv(self):
+        return self._view("hsv", lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2HSV))
+
+    @property
+    def rgb(self):
+        return self._view("rgb", lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB))
+
+    @property
+    def td_bgr(self):
+        """
+        Image with the line of scrimmage blacked out and touchdown blue recolored to
+        yellow, so that touchdowns can be separated from the line of scrimmage.
+        """
+        return self._view("td_bgr", self._highlight_touchdowns)
+
+    @property
+    def td_hsv(self):
+        return self._view("td_hsv", lambda: cv2.cvtColor(self.td_bgr, cv2.COLOR_BGR2HSV))
+
+    def mask(self, pass_type):
+        """
+        Function to get the binary color mask of a pass type.
+
+        Input:
+            pass_type: "COMPLETE", "INCOMPLETE", "INTERCEPTION", or "TOUCHDOWN"
+        Return:
+            mask: numpy.ndarray, 255 where the image has the color of pass_type
+        """
+        if pass_type not in self._masks:
+            with instrument.timer("mask:" + pass_type):
+                space, lower, upper = COLOR_RANGES[pass_type]
+                image = self.bgr if space == "bgr" else getattr(self, space)
+                self._masks[pass_type] = cv2.inRange(image, lower, upper)
+        return self._masks[pass_type]
+
+    def _highlight_touchdowns(self):
+        img = self.rgb.copy()
+
+        # black out the line of scrimmage band so it isn't picked up as a touchdown
+        img[self._los_band()] = 0
+
+        # recolor touchdown blue (20,80,200) to yellow
+        rgb = img.astype(np.int32)
+        f = (rgb[:,:,0]-20)**2 + (rgb[:,:,1]-80)**2 + (rgb[:,:,2]-200)**2
+        img[(f < 32**2) & (rgb[:,:,2] > 100)] = (255, 255, 0)
+
+        # jpeg round trip in memory, as the detector was tuned on the re-read jpeg
+        from PIL import Image
+        buf = io.BytesIO()
+        Image.fromarray(img).save(buf, "JPEG")
+        return cv2.imdecode(np.frombuffer(buf.getvalue(), np.uint8), cv2.IMREAD_COLOR)
+
+    def _los_band(self):
+        """
+        Rows of the line of scrimmage band of this chart's image.
+        """
+        row, col, s = self.row, self.col, self.scale
+        if col < 1370:
+            return slice((row-110)//s, -((105-row)//s))
+        elif col > 1370:
+            return slice((row-85)//s, -((81-row)//s))
+        return slice(0, 0)
+
+    def _window_mask(self, pass_type, r0, r1, c0, c1):
+        """
+        Function to get the color mask of pass_type in a window of the image, converting
+        only the window. Touchdowns are never refined, see full_resolution().
+        """
+        window = self.bgr[r0:r1, c0:c1]
+        space, lower, upper = COLOR_RANGES[pass_type]
+        if space == "hsv":
+            window = cv2.cvtColor(window, cv2.COLOR_BGR2HSV)
+        return cv2.inRange(window, lower, upper) != 0
+
+    def refine(self, centers, pass_type):
+        """
+        Function to map centers found on a reduced chart to the full resolution chart. Every
+        full resolution pixel of the color of pass_type within REFINE_RADIUS + scale of a
+        center goes to the nearest center, and each center moves to the mean of its pixels.
+
+        Input:
+            centers: centers found on this chart, as (row, column) pixels
+            pass_type: "COMPLETE", "INCOMPLETE", or "INTERCEPTION"
+        Return:
+            centers: numpy.ndarray of the centers in full resolution pixels
+        """
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        if self.scale == 1 or len(centers) == 0:
+            return centers
+
+        s = self.scale
+        full = self.full
+        centers = (centers + 0.5)*s - 0.5
+        radius = REFINE_RADIUS + s
+
+        with instrument.timer("refine:" + pass_type) as t:
+            points = []
+            for (r, c) in np.round(centers).astype(int):
+                r0, r1 = max(r - radius, 0), min(r + radius + 1, full.row)
+                c0, c1 = max(c - radius, 0), min(c + radius + 1, full.col)
+                rows, cols = np.nonzero(full._window_mask(pass_type, r0, r1, c0, c1))
+                points.append(np.column_stack([rows + r0, cols + c0]))
+            points = np.unique(np.concatenate(points), axis=0)
+
+            d2 = ((points[:, None, :] - centers[None, :, :])**2).sum(axis=2)
+            nearest = d2.argmin(axis=1)
+            near = d2[np.arange(len(points)), nearest] <= radius**2
+            points, nearest = points[near], nearest[near]
+
+            counts = np.bincount(nearest, minlength=len(centers))
+            found = counts > 0
+            for j in (0, 1):
+                sums = np.bincount(nearest, weights=points[:, j], minlength=len(centers))
+                centers[found, j] = sums[found]/counts[found]
+            t.set(pixels=len(points), clusters=len(centers))
+        return centers
+
+
+def as_chart(image):
+    """
+    Return image as a Chart, decoding it if it is a file path.
+    """
+    if isinstance(image, Chart):
+        return image
+    return Chart.read(image)
@@ -15,33 +15,59 @@ Example:
 import cv2
 import os
 from undistort_field import *
-from pass_detection import *
 import json
-import scipy.misc
+import argparse
+import instrument
 
-def new_image(image):
+# quality of the saved cleaned images, the PIL default the detectors were tuned on
+JPEG_QUALITY = 75
 
-	img_name = image.split(os.sep)[-1].split(".")[0]
-	img = cv2.imread(image)
+# fields of the pass chart data that are kept in the cleaned data
+keys = ['completions', 'passingYards', 'touchdowns', 'playerNameSlug', 
+	'teamId', 'interceptions',  'playerName', 'season', 'position',
+	'type', 'week', 'gameId', 'esbId', 'firstName', 'lastName', 
+	'attempts', 'team'
+]
+
+clean_path = "Cleaned_Pass_Charts"
 
+def crop_chart(img):
+	"""
+	Crop the field of a (1200, 1200) pass chart image, or return None for any other size.
+	"""
 	if (img.shape[0:2] == (1200, 1200)):
-		crop_img = img[0:680, 0:1200]
-		temp_name = img_name + "_temp.jpg"
-		cv2.imwrite(temp_name, crop_img)
-	else:
-		print("Image must be of size (1200, 1200)")
+		return img[0:680, 0:1200]
+	print("Image must be of size (1200, 1200)")
+
+def new_image(image, clean_path=clean_path):
+	"""
+	Clean the pass chart image at the path image, and write it to the same folders under 
+	clean_path. Returns the path of the cleaned image, or None if it couldn't be cleaned.
+	"""
+
+	img_name = image.split(os.sep)[-1].split(".")[0]
+	with instrument.timer("read"):
+		img = cv2.imread(image)
+
+	crop_img = crop_chart(img)
+	if crop_img is None:
 		return
 
-	clean_img = clean_field(temp_name)
+	clean_img = clean_field(crop_img)
 	write_path = clean_path + os.sep + os.sep.join(image.split(os.sep)[1:-1]) 
 	if not os.path.exists(write_path): os.makedirs(write_path)
 
-	if (clean_img != None):
+	if (clean_img is not None):
 		write_name = write_path + os.sep + img_name + ".jpeg"
-		scipy.misc.imsave(write_name, clean_img)
-	os.remove(temp_name)
-
-def new_data(folder, image): 
+		with instrument.timer("write"):
+			cv2.imwrite(write_name, clean_img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+		return write_name
+
+def new_data(folder, image, clean_path=clean_path): 
+	"""
+	Copy the data of the pass chart image in folder to the same folders under clean_path, 
+	keeping only keys. Returns the path of the cleaned data.
+	"""
 	data_path = os.sep.join(folder.split(os.sep)[:-1]) + os.sep + "data" 
 	data_file = data_path + os.sep + image.split(".")[0] + ".txt"
 	new_data_path = clean_path + os.sep + os.sep.join(folder.split(os.sep)[1:-1]) + os.sep + "data" 
@@ -56,17 +82,16 @@ def new_data(folder, image):
 		new_data = {key: old_data[key] for key in keys}
 	with open(new_data_file, "w") as _file:
 		json.dump(new_data, _file)
+	return new_data_file
 
 
 
 if __name__ == '__main__':
-	keys = ['completions', 'passingYards', 'touchdowns', 'playerNameSlug', 
-		'teamId', 'interceptions',  'playerName', 'season', 'position',
-		'type', 'week', 'gameId', 'esbId', 'firstName', 'lastName', 
-		'attempts', 'team'
-	]
-
-	clean_path = "Cleaned_Pass_Charts"
+	parser = argparse.ArgumentParser(description='Clean pass chart images and data')
+	parser.add_argument('--metrics', type=str, dest='metrics', default=None, 
+		help='record the time of every stage of every chart to this file, and print a summary')
+	args = parser.parse_args()
+	if args.metrics: instrument.enable(args.metrics)
 
 	if not os.path.exists(clean_path): os.makedirs(clean_path)
 
@@ -78,9 +103,11 @@ if __name__ == '__main__':
 		images = os.listdir(folder)
 		for image in images:
 			if not image.startswith("."): 
-				new_image(os.path.join(folder, image))
-				new_data(folder, image)
+				with instrument.chart(os.path.join(folder, image)):
+					new_image(os.path.join(folder, image))
+					new_data(folder, image)
 	print("Done.")
+	if args.metrics: instrument.summary(args.metrics)
 
 
 
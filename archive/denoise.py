@@ -0,0 +1,128 @@
+"""
+Denoising strategies for the masked pass marker images in pass_detection.py. The detectors
+only use which pixels are nonzero after denoising, so every strategy takes the masked image
+(color or greyscale) and returns an image of the same shape whose nonzero pixels are the
+ones to keep.
+
+Run bench_denoise.py to compare the speed and the drift in detected pass locations of the
+strategies on a folder of cleaned pass charts.
+"""
+
+import cv2
+import json
+import numpy as np
+import instrument
+
+
+def nlmeans(res, h=3):
+    """
+    Non-local means denoising, as originally used by the detectors.
+    """
+    if res.ndim == 3:
+        return cv2.fastNlMeansDenoisingColored(res, h=h)
+    return cv2.fastNlMeansDenoising(res, h=h)
+
+def _keep(res, keep):
+    """
+    Zero the pixels of res outside of the binary image keep.
+    """
+    return cv2.bitwise_and(res, res, mask=keep.astype(np.uint8))
+
+def _mask(res):
+    mask = res.any(axis=2) if res.ndim == 3 else (res != 0)
+    return mask.astype(np.uint8)*255
+
+def morphology(res, ksize=3):
+    """
+    Morphological opening, to remove specks, then closing, to fill small holes.
+    """
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (ksize, ksize))
+    mask = cv2.morphologyEx(_mask(res), cv2.MORPH_OPEN, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    return _keep(res, mask)
+
+def median(res, ksize=5):
+    """
+    Median filter of the binary mask.
+    """
+    return _keep(res, cv2.medianBlur(_mask(res), ksize))
+
+def component_area(res, min_area=20):
+    """
+    Drop 8-connected components smaller than min_area pixels.
+    """
+    n_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(_mask(res),
+        connectivity=8)
+    big = stats[:, cv2.CC_STAT_AREA] >= min_area
+    big[0] = False
+    return _keep(res, big[labels])
+
+def none(res):
+    return res
+
+
+DENOISERS = {
+    "nlmeans": nlmeans,
+    "morphology": morphology,
+    "median": median,
+    "area": component_area,
+    "none": none,
+}
+
+# strategy and parameters used by each detector, as (name, params)
+DEFAULT_DENOISE = {
+    "INCOMPLETE": ("nlmeans", {}),
+    "INTERCEPTION": ("nlmeans", {"h": 10}),
+    "TOUCHDOWN": ("nlmeans", {"h": 10}),
+}
+
+
+def parse_denoisers(specs):
+    """
+    Function to parse strategies given on the command line as "TYPE=NAME", e.g.
+    "INCOMPLETE=morphology", each with the default parameters of NAME.
+
+    Input:
+        specs: list of "TYPE=NAME" strings, or None
+    Return:
+        denoisers: dict of the (name, params) of each pass type given
+    """
+    denoisers = {}
+    for spec in specs or []:
+        pass_type, _, name = spec.partition("=")
+        pass_type = pass_type.upper()
+        if (pass_type not in DEFAULT_DENOISE) or (name not in DENOISERS):
+            raise ValueError("denoise strategy %r is not TYPE=NAME, with TYPE one of %s and NAME "
+                "one of %s" % (spec, ", ".join(DEFAULT_DENOISE), ", ".join(DENOISERS)))
+        denoisers[pass_type] = (name, {})
+    return denoisers
+
+def effective_denoisers(denoisers=None):
+    """
+    Strategy of every pass type, from denoisers or else DEFAULT_DENOISE.
+    """
+    return dict(DEFAULT_DENOISE, **(denoisers or {}))
+
+def denoise_tag(denoisers=None):
+    """
+    Function to get a tag of the strategy of every pass type, which is part of the version of
+    cached results, so that results of other strategies, or of other defaults, aren't used.
+    """
+    return json.dumps(sorted(effective_denoisers(denoisers).items()), sort_keys=True,
+        separators=(",", ":"))
+
+def denoise(res, pass_type, strategy=None):
+    """
+    Function to denoise a masked image with the strategy of a pass type.
+
+    Input:
+        res: masked image, color or greyscale
+        pass_type: "INCOMPLETE", "INTERCEPTION", or "TOUCHDOWN"
+        strategy: (name, params) of the strategy to use, or None for DEFAULT_DENOISE[pass_type]
+    Return:
+        res: denoised image, nonzero on the pixels that are kept
+    """
+    (name, params) = strategy or DEFAULT_DENOISE[pass_type]
+    with instrument.timer("denoise:" + pass_type) as t:
+        t.set(denoiser=name)
+        return DENOISERS[name](res, **params)
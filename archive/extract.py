@@ -0,0 +1,164 @@
+"""
+In-memory extraction of pass locations, for services that have the images and counts of pass
+charts in memory, rather than in the folders 'Pass_Charts' and 'Cleaned_Pass_Charts'.
+
+A chart is decoded from the bytes of its image, cleaned as clean.py does, and round tripped
+through JPEG in memory as the cleaned image is when clean.py writes it and main.py reads it
+again, so the pass locations are those of main.py. They are returned as a structured numpy
+array of PASS_DTYPE, in the order of main.py: completions, touchdowns, interceptions and then
+incompletions, with NaN x and y for passes that couldn't be located.
+
+Usage:
+	from extract import chart_passes, batch_passes
+	passes = chart_passes(image_bytes, {"attempts": 31, "completions": 22, "touchdowns": 2,
+		"interceptions": 1})
+	passes, offsets = batch_passes(charts)	# charts is an iterable of (image_bytes, counts)
+"""
+
+import cv2
+import numpy as np
+import clean
+import instrument
+from chart import Chart
+from undistort_field import clean_field
+from pass_detection import completions, touchdowns, interceptions, incompletions
+from denoise import DEFAULT_DENOISE
+
+# pass type, and x and y in yards from the center of the field and the line of scrimmage
+PASS_DTYPE = np.dtype([("pass_type", "U12"), ("x", "f8"), ("y", "f8")])
+
+# detector of each pass type, in the order of main.py
+DETECTORS = [("COMPLETE", completions), ("TOUCHDOWN", touchdowns),
+	("INTERCEPTION", interceptions), ("INCOMPLETE", incompletions)]
+
+
+def pass_counts(data):
+	"""
+	Function to get the number of passes of each type of a pass chart.
+
+	Input:
+		data: dict with the "attempts", "completions", "touchdowns" and "interceptions" of
+			the chart, such as its data from Next Gen Stats
+	Return:
+		(n_completions, n_touchdowns, n_interceptions, n_incompletes)
+	"""
+	n_completions = data["completions"] - data["touchdowns"]
+	n_touchdowns = data["touchdowns"]
+	n_interceptions = data["interceptions"]
+	n_incompletes = data["attempts"] - n_completions - n_interceptions - n_touchdowns
+	return (n_completions, n_touchdowns, n_interceptions, n_incompletes)
+
+def clean_chart(image, buffers=None):
+	"""
+	Function to decode and clean a pass chart image in memory.
+
+	Input:
+		image: bytes of the pass chart image, as downloaded from Next Gen Stats
+		buffers: dict of arrays reused by clean_field between charts, or None
+	Return:
+		chart: Chart of the cleaned image, or None if it couldn't be cleaned
+	"""
+	with instrument.timer("read"):
+		img = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+	if img is None:
+		raise ValueError("image bytes could not be decoded")
+
+	crop_img = clean.crop_chart(img)
+	if crop_img is None:
+		return None
+	clean_img = clean_field(crop_img, buffers)
+	if clean_img is None:
+		return None
+
+	# the detectors were tuned on the cleaned image as written and read again
+	with instrument.timer("write"):
+		ok, jpeg = cv2.imencode(".jpeg", clean_img, [cv2.IMWRITE_JPEG_QUALITY, clean.JPEG_QUALITY])
+	with instrument.timer("decode"):
+		return Chart(cv2.imdecode(jpeg, cv2.IMREAD_COLOR))
+
+def detect(chart, counts, scale=1, denoisers=None):
+	"""
+	Function to detect the passes of a cleaned chart.
+
+	Input:
+		chart: Chart of the cleaned image, or None if there is no image
+		counts: number of passes of each type, as returned by pass_counts
+		scale: factor to reduce the image by for detection, see main.detect_passes
+		denoisers: denoise strategies of the detectors, see main.detect_passes
+	Return:
+		generator of (pass_type, x, y), with x and y numpy.ndarray of the passes of pass_type
+	"""
+	if chart is not None:
+		chart = chart.reduced(scale)
+	for ((pass_type, detector), n) in zip(DETECTORS, counts):
+		if n == 0:
+			continue
+		if chart is None:
+			yield pass_type, np.full(n, np.nan), np.full(n, np.nan)
+			continue
+		with instrument.timer("detect:" + pass_type):
+			if pass_type in DEFAULT_DENOISE:
+				df = detector(chart, n, (denoisers or {}).get(pass_type))
+			else:
+				df = detector(chart, n)
+		yield pass_type, df["x"].values, df["y"].values
+
+def chart_passes(image, data, scale=1, buffers=None, denoisers=None):
+	"""
+	Function to extract the locations of all passes of one pass chart, in memory.
+
+	Input:
+		image: bytes of the pass chart image, as downloaded from Next Gen Stats
+		data: dict with the pass counts of the chart, see pass_counts
+		scale: factor to reduce the image by for detection, see main.detect_passes
+		buffers: dict of arrays reused by clean_field between charts, or None
+		denoisers: denoise strategies of the detectors, see main.detect_passes
+	Return:
+		passes: numpy.ndarray of PASS_DTYPE, one element per pass
+	"""
+	chart = clean_chart(image, buffers)
+	parts = list(detect(chart, pass_counts(data), scale, denoisers))
+	passes = np.empty(sum(len(x) for (pass_type, x, y) in parts), dtype=PASS_DTYPE)
+	i = 0
+	for (pass_type, x, y) in parts:
+		passes["pass_type"][i:i + len(x)] = pass_type
+		passes["x"][i:i + len(x)] = x
+		passes["y"][i:i + len(x)] = y
+		i += len(x)
+	return passes
+
+def batch_passes(charts, scale=1, capacity=1024, denoisers=None):
+	"""
+	Function to extract the locations of all passes of many pass charts, in memory.
+
+	The bordered and undistorted images of every chart are written into the same buffers,
+	and the passes of every chart into one array, which grows by doubling.
+
+	Input:
+		charts: iterable of (image, data), with image the bytes of a pass chart image and
+			data a dict with its pass counts, see pass_counts
+		scale: factor to reduce the images by for detection, see main.detect_passes
+		capacity: number of passes the array of passes starts with room for
+		denoisers: denoise strategies of the detectors, see main.detect_passes
+	Return:
+		passes: numpy.ndarray of PASS_DTYPE of the passes of all charts
+		offsets: int64 numpy.ndarray, the passes of chart i are passes[offsets[i]:offsets[i+1]]
+	"""
+	buffers = {}
+	passes = np.empty(capacity, dtype=PASS_DTYPE)
+	offsets = [0]
+	i = 0
+	for (image, data) in charts:
+		with instrument.chart(str(len(offsets) - 1)):
+			chart = clean_chart(image, buffers)
+			for (pass_type, x, y) in detect(chart, pass_counts(data), scale, denoisers):
+				if i + len(x) > len(passes):
+					grown = np.empty(max(2*len(passes), i + len(x)), dtype=PASS_DTYPE)
+					grown[:i] = passes[:i]
+					passes = grown
+				passes["pass_type"][i:i + len(x)] = pass_type
+				passes["x"][i:i + len(x)] = x
+				passes["y"][i:i + len(x)] = y
+				i += len(x)
+		offsets.append(i)
+	return passes[:i], np.array(offsets, dtype=np.int64)
@@ -0,0 +1,69 @@
+"""
+HTTP client shared by the scraping threads: one requests.Session whose connection pool
+keeps connections to Next Gen Stats alive between requests, retries failed requests with
+exponential backoff, and spaces requests out to a maximum rate.
+"""
+
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class RateLimiter(object):
+	"""
+	Allow at most rate calls to wait() per second, across all threads.
+	"""
+
+	def __init__(self, rate=None):
+		self.interval = 1.0/rate if rate else 0.0
+		self._next = 0.0
+		self._lock = threading.Lock()
+
+	def wait(self):
+		if self.interval == 0.0:
+			return
+		with self._lock:
+			now = time.monotonic()
+			start = max(now, self._next)
+			self._next = start + self.interval
+		if start > now:
+			time.sleep(start - now)
+
+
+class Fetcher(object):
+	"""
+	Pooled, rate limited HTTP client with retries.
+
+	Input:
+		concurrency: number of threads that will share the client, and size of the connection pool
+		rate: maximum requests per second, or None for no limit
+		retries: number of times a failed request is retried
+		backoff: backoff factor in seconds, retry i waits backoff*2**(i-1)
+		timeout: timeout of a single request in seconds
+	"""
+
+	def __init__(self, concurrency=8, rate=None, retries=5, backoff=0.5, timeout=30):
+		retry = Retry(total=retries, backoff_factor=backoff,
+			status_forcelist=(429, 500, 502, 503, 504))
+		adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency,
+			max_retries=retry)
+
+		self.session = requests.Session()
+		self.session.mount("http://", adapter)
+		self.session.mount("https://", adapter)
+		self.limiter = RateLimiter(rate)
+		self.timeout = timeout
+
+	def get(self, url, **kwargs):
+		"""
+		GET url, raising requests.HTTPError if the final response is an error.
+		"""
+		self.limiter.wait()
+		r = self.session.get(url, timeout=self.timeout, **kwargs)
+		r.raise_for_status()
+		return r
+
+	def close(self):
+		self.session.close()
@@ -0,0 +1,106 @@
+"""
+Local stand-in for Next Gen Stats, serving pass chart listing pages and images of synthetic
+charts from synthetic.py, for testing scrape.py, pipeline.py and watch.py without the network.
+
+Every listing page starts out empty and the charts of one week are published at a time, every
+--every seconds, as Next Gen Stats posts a week's charts during the season. Pages and images
+are plain files served with Last-Modified, so conditional requests of unchanged pages get 304.
+
+Usage:
+	python fixture_server.py --port 8000 --weeks 1 2 3 --charts 4 --every 30
+	python watch.py -t synthetic -s 2000 -w 1 2 3 --base-url http://localhost:8000 --interval 5
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+import functools
+import cv2
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from synthetic import make_chart
+
+# parse_charts reads the charts from between the first 33 and the last 131 characters of the
+# script that holds them
+SCRIPT_PREFIX = "<script>window.__INITIAL_STATE__="
+SCRIPT_SUFFIX = ";/*" + " "*(131 - len("*/</script>") - 3) + "*/</script>"
+assert len(SCRIPT_PREFIX) == 33 and len(SCRIPT_SUFFIX) == 131
+
+
+def listing_page(charts):
+	"""
+	HTML of a listing page with charts, in the format that scrape.parse_charts reads.
+	"""
+	state = {"charts": {"charts": {"charts": charts} if charts else {}}}
+	return "<html><body>" + SCRIPT_PREFIX + json.dumps(state) + SCRIPT_SUFFIX + "</body></html>"
+
+def _write(path, content):
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	mode = "wb" if isinstance(content, bytes) else "w"
+	with open(path + ".tmp", mode) as _file:
+		_file.write(content)
+	os.replace(path + ".tmp", path)
+
+def publish(root, team, season, week, seeds):
+	"""
+	Function to publish synthetic charts on the listing page of a team in a week.
+
+	Input:
+		root: root folder served by the fixture server
+		team, season, week: listing page to publish on
+		seeds: seeds of the synthetic charts, an empty list for an empty page
+	"""
+	charts = []
+	for seed in seeds:
+		image, data, truth = make_chart(seed)
+		name = data["lastName"] + "_" + data["firstName"] + "_" + data["position"]
+		url = "/images/%s/%s/%s/%s.jpeg" % (team, season, week, name)
+		_write(os.path.join(root, url.lstrip("/")), cv2.imencode(".jpeg", image)[1].tobytes())
+		data.update(season=season, week=week, extraLargeImg=url)
+		charts.append(data)
+	_write(os.path.join(root, "charts", "list", "pass", team, season, week), listing_page(charts))
+
+def serve(root, port=8000):
+	"""
+	Function to start serving root on localhost:port in a background thread.
+
+	Return:
+		server: ThreadingHTTPServer, stopped with server.shutdown()
+	"""
+	handler = functools.partial(SimpleHTTPRequestHandler, directory=root)
+	server = ThreadingHTTPServer(("localhost", port), handler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Serve synthetic pass charts that are published over time')
+	parser.add_argument('--root', type=str, dest='root', default="Fixture_Site",
+		help='folder the pages and images are written to and served from')
+	parser.add_argument('-p', '--port', type=int, dest='port', default=8000, help='port to serve on')
+	parser.add_argument('-t', '--team', type=str, dest='team', default="synthetic", help='team of the charts')
+	parser.add_argument('-s', '--season', type=str, dest='season', default="2000", help='season of the charts')
+	parser.add_argument('-w', '--weeks', nargs='+', type=str, dest='weeks', default=["1", "2", "3"],
+		help='weeks to publish, in order')
+	parser.add_argument('-n', '--charts', type=int, dest='charts', default=4,
+		help='number of charts published each week')
+	parser.add_argument('--every', type=float, dest='every', default=30,
+		help='seconds between publishing weeks')
+	args = parser.parse_args()
+
+	for week in args.weeks:
+		publish(args.root, args.team, args.season, week, [])
+	server = serve(args.root, args.port)
+	print("Serving", args.root, "on http://localhost:%d" % args.port)
+
+	try:
+		for (i, week) in enumerate(args.weeks):
+			time.sleep(args.every)
+			publish(args.root, args.team, args.season, week,
+				range(i*args.charts, (i + 1)*args.charts))
+			print(time.strftime("%H:%M:%S"), "published week", week)
+		while True:
+			time.sleep(3600)
+	except KeyboardInterrupt:
+		server.shutdown()
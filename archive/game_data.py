@@ -1,18 +1,26 @@
+"""
+Add the game information (season, home team, away team and regular or postseason) to the
+pass locations in 'pass_locations.csv', and write them to 'pass_and_game_data.csv'.
+
+The games of each season are cached in '[games_path]/games_[season].csv', with the columns
+game_id, season, home_team and away_team. A season that isn't cached yet is read once from
+the schedule bundled with nflgame, which doesn't need the network; a games .csv file from
+any other source can also be put in the cache folder instead.
+
+Only the rows appended to 'pass_locations.csv' since the last run are joined and appended to
+'pass_and_game_data.csv'. If 'pass_locations.csv' was rewritten rather than appended to,
+the whole file is joined again.
+"""
+
+import os
+import io
+import json
+import hashlib
+import argparse
 import numpy as np
-import nflgame
 import pandas as pd
-games = nflgame.games(2019)
-
-game_stat = []
-for game in games:
-    game_stat.append([game.eid,game.season(),game.home,game.away])
-    
-game_df = pd.DataFrame(game_stat,columns = ['game_id','season','home_team','away_team'])
-game_df.game_id = game_df.game_id.astype(int)
-pass_location = pd.read_csv('pass_locations.csv')
 
-pass_and_game_data = pd.merge(pass_location,game_df,on='game_id')
-pass_and_game_data['type'] = pass_and_game_data.week.apply(lambda x: 'reg' if str(x).isdigit() else 'post')
+GAME_COLUMNS = ['game_id', 'season', 'home_team', 'away_team']
 
 teams = ["arizona-cardinals",
 	"atlanta-falcons",
@@ -51,11 +59,161 @@ teams = ["arizona-cardinals",
 
 team_abbv = ['ARI', 'ATL', 'BAL', 'BUF', 'CAR', 'CHI', 'CIN', 'CLE', 'DAL',
        'DEN', 'DET', 'GB', 'HOU', 'IND', 'JAX', 'KC', 'LAC', 'LA', 'MIA',
-       'MIN', 'NE', 'NO', 'NYG', 'NYJ', 'OAK', 'PHI', 'PIT', 'SEA', 'SF',
+       'MIN', 'NE', 'NO', 'NYG', 'NYJ', 'OAK', 'PHI', 'PIT', 'SF', 'SEA',
        'TB', 'TEN', 'WAS']
 
-pass_and_game_data['team'] = pass_and_game_data['team'].replace(teams,team_abbv)
-pass_and_game_data['home_team'] = pass_and_game_data['home_team'].replace(teams,team_abbv)
-pass_and_game_data['away_team'] = pass_and_game_data['away_team'].replace(teams,team_abbv)
+TEAM_ABBV = dict(zip(teams, team_abbv))
+
+# games of every season loaded so far
+_games = {}
+
+
+def _schedule_games(season):
+    """
+    Function to get the regular and postseason games of a season from the schedule
+    bundled with nflgame, without any network requests.
+    """
+    import nflgame.sched
+    game_stat = [[int(g['eid']), int(season), g['home'], g['away']]
+        for g in nflgame.sched.games.values()
+        if g['year'] == int(season) and g['season_type'] != 'PRE']
+    return pd.DataFrame(game_stat, columns = GAME_COLUMNS)
+
+def season_games(season, games_path="Game_Data"):
+    """
+    Function to get the games of a season, from the cache if it is there.
+
+    Input:
+        season: season of the games, e.g. 2019
+        games_path: folder of the cached games .csv files
+    Return:
+        games: Pandas DataFrame with the columns GAME_COLUMNS
+    """
+    season = int(season)
+    if season not in _games:
+        games_file = os.path.join(games_path, "games_%d.csv" % season)
+        if not os.path.exists(games_file):
+            os.makedirs(games_path, exist_ok=True)
+            _schedule_games(season).to_csv(games_file + ".tmp", index=False)
+            os.replace(games_file + ".tmp", games_file)
+        games = pd.read_csv(games_file, dtype={'home_team': str, 'away_team': str})
+        games['game_id'] = games['game_id'].astype(np.int64)
+        _games[season] = games[GAME_COLUMNS]
+    return _games[season]
+
+def map_teams(s):
+    """
+    Function to map team names, such as 'kansas-city-chiefs', to their abbreviations.
+    Only the distinct names are mapped, and names that aren't in TEAM_ABBV are kept.
+    """
+    return s.astype('category').map(lambda team: TEAM_ABBV.get(team, team)).astype(object)
+
+def add_game_data(pass_location, seasons=None, games_path="Game_Data"):
+    """
+    Function to join pass locations to the games they were thrown in.
+
+    Input:
+        pass_location: Pandas DataFrame of pass locations, as written by main.py
+        seasons: seasons of the games to join to, by default the seasons in pass_location
+        games_path: folder of the cached games .csv files
+    Return:
+        pass_and_game_data: Pandas DataFrame of the pass locations with the game columns and
+            the type of game ('reg' or 'post'), without the passes of unknown games
+    """
+    if seasons is None:
+        if 'season' not in pass_location:
+            raise ValueError("pass locations have no season column, give the seasons of the games")
+        seasons = pd.to_numeric(pass_location['season'], errors='coerce').dropna().unique()
+    game_df = pd.concat([season_games(season, games_path) for season in seasons] or
+        [pd.DataFrame(columns = GAME_COLUMNS)], ignore_index=True)
+
+    pass_location = pass_location.drop(columns=['season'], errors='ignore')
+    pass_location['game_id'] = pd.to_numeric(pass_location['game_id'], errors='coerce')
+    pass_and_game_data = pd.merge(pass_location, game_df, on='game_id')
+
+    week = pass_and_game_data['week'].astype(str)
+    pass_and_game_data['type'] = np.where(week.str.isdigit(), 'reg', 'post')
+
+    for column in ['team', 'home_team', 'away_team']:
+        pass_and_game_data[column] = map_teams(pass_and_game_data[column])
+    return pass_and_game_data
+
+def _prefix_sha256(path, offset):
+    h = hashlib.sha256()
+    with open(path, "rb") as _file:
+        while offset > 0:
+            block = _file.read(min(offset, 1 << 20))
+            if not block:
+                break
+            h.update(block)
+            offset -= len(block)
+    return h.hexdigest()
+
+def update_game_data(in_file="pass_locations.csv", out_file="pass_and_game_data.csv",
+    seasons=None, games_path="Game_Data", full=False):
+    """
+    Function to append the game information of the pass locations added to in_file since the
+    last run to out_file.
+
+    The byte offset of in_file read so far, and a hash of those bytes, are kept in
+    '[out_file].state', so the rows that were already joined are never read again.
+
+    Input:
+        in_file: .csv file of pass locations, as written by main.py
+        out_file: .csv file of pass locations with game information
+        seasons: seasons of the games to join to, by default the seasons in in_file
+        games_path: folder of the cached games .csv files
+        full: if True, join all of in_file again
+    Return:
+        n_rows: number of rows appended to out_file
+    """
+    state_file = out_file + ".state"
+    state = None
+    if (not full) and os.path.exists(state_file) and os.path.exists(out_file):
+        with open(state_file) as _file:
+            state = json.load(_file)
+        if (os.path.getsize(in_file) < state["offset"]) or \
+            (_prefix_sha256(in_file, state["offset"]) != state["sha256"]):
+            state = None
+
+    with open(in_file, "rb") as _file:
+        header = _file.readline()
+        start_offset = state["offset"] if state is not None else len(header)
+        _file.seek(start_offset)
+        new = _file.read()
+
+    # only read up to the last complete line, the rest is still being written
+    new = new[:new.rfind(b"\n") + 1]
+    offset = start_offset + len(new)
+
+    pass_location = pd.read_csv(io.BytesIO(header + new), dtype={'week': str})
+    pass_and_game_data = add_game_data(pass_location, seasons, games_path)
+
+    # the index continues from the rows already in out_file
+    start = state["rows"] if state is not None else 0
+    pass_and_game_data.index = np.arange(start, start + len(pass_and_game_data))
+    if state is None:
+        pass_and_game_data.to_csv(out_file)
+    else:
+        pass_and_game_data.to_csv(out_file, mode="a", header=False)
+
+    state = {"offset": offset, "sha256": _prefix_sha256(in_file, offset),
+        "rows": start + len(pass_and_game_data)}
+    with open(state_file + ".tmp", "w") as _file:
+        json.dump(state, _file)
+    os.replace(state_file + ".tmp", state_file)
+    return len(pass_and_game_data)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Add game information to the extracted pass locations')
+    parser.add_argument('-s', '--seasons', nargs='+', type=int, dest='seasons', default=None,
+        help='seasons of the games, by default the seasons in pass_locations.csv')
+    parser.add_argument('--games', type=str, dest='games_path', default="Game_Data",
+        help='folder of the cached games of each season')
+    parser.add_argument('--full', action='store_true', dest='full',
+        help='join all of pass_locations.csv again, not only the new rows')
+    args = parser.parse_args()
 
-pass_and_game_data.to_csv("./pass_and_game_data.csv")
+    n_rows = update_game_data(seasons=args.seasons, games_path=args.games_path, full=args.full)
+    print(n_rows, "rows added to pass_and_game_data.csv")
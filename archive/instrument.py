@@ -0,0 +1,144 @@
+"""
+Optional per stage instrumentation of clean.py and main.py.
+
+When enabled, every timed stage of every chart appends a JSON line with the chart, the
+stage, its wall time in seconds, the number of timed stages it is inside of (depth) and any
+pixel or cluster counts to a metrics file, and
+summary() prints the stage percentiles and the slowest charts. When disabled, timer() and
+chart() return a shared object that does nothing, so instrumented code costs close to nothing.
+
+Worker processes inherit the metrics file through the NGS_METRICS environment variable.
+"""
+
+import os
+import json
+import time
+
+
+_state = {"file": None, "chart": None, "depth": 0}
+
+
+def enable(path, truncate=True):
+	"""
+	Function to start recording metrics to path, in this process and in worker processes
+	started after it.
+	"""
+	if truncate:
+		open(path, "w").close()
+	os.environ["NGS_METRICS"] = path
+	_state["file"] = open(path, "a", buffering=1)
+
+def enabled():
+	return _state["file"] is not None
+
+def record(stage, seconds, **counts):
+	"""
+	Function to append the metrics of a stage of the current chart to the metrics file.
+	"""
+	if _state["file"] is None:
+		return
+	line = dict(counts, chart=_state["chart"], stage=stage, seconds=seconds, depth=_state["depth"])
+	_state["file"].write(json.dumps(line) + "\n")
+
+
+class _Timer(object):
+	__slots__ = ("stage", "counts", "start")
+
+	def __init__(self, stage):
+		self.stage = stage
+		self.counts = {}
+
+	def set(self, **counts):
+		self.counts.update(counts)
+
+	def __enter__(self):
+		_state["depth"] += 1
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		seconds = time.perf_counter() - self.start
+		_state["depth"] -= 1
+		record(self.stage, seconds, **self.counts)
+
+
+class _Chart(object):
+	__slots__ = ("key", "previous")
+
+	def __init__(self, key):
+		self.key = key
+
+	def __enter__(self):
+		self.previous = _state["chart"]
+		_state["chart"] = self.key
+		return self
+
+	def __exit__(self, *exc):
+		_state["chart"] = self.previous
+
+
+class _Null(object):
+	def set(self, **counts):
+		pass
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		pass
+
+_null = _Null()
+
+
+def timer(stage):
+	"""
+	Context manager that records the wall time of stage. Counts can be added with set(),
+	e.g. t.set(pixels=len(X), clusters=n).
+	"""
+	if _state["file"] is None:
+		return _null
+	return _Timer(stage)
+
+def chart(key):
+	"""
+	Context manager that attributes the stages timed inside it to the chart key.
+	"""
+	if _state["file"] is None:
+		return _null
+	return _Chart(key)
+
+def summary(path, n_slowest=10):
+	"""
+	Function to print the time percentiles of every stage, and the slowest charts, of the
+	metrics in path. The time of a chart is the sum of its top level stages, since the time
+	of a stage timed inside another one, e.g. mask:* inside detect:*, is already in it.
+	"""
+	stages = {}
+	charts = {}
+	with open(path) as _file:
+		for line in _file:
+			try:
+				m = json.loads(line)
+			except ValueError:
+				continue
+			stages.setdefault(m["stage"], []).append(m["seconds"])
+			if (m["chart"] is not None) and (m.get("depth", 0) == 0):
+				charts[m["chart"]] = charts.get(m["chart"], 0.0) + m["seconds"]
+
+	def percentile(values, q):
+		return values[min(len(values) - 1, int(q*len(values)))]
+
+	print("\n%-16s %8s %10s %9s %9s %9s %9s" % ("stage", "count", "total s", "p50 ms",
+		"p90 ms", "p99 ms", "max ms"))
+	for stage in sorted(stages, key=lambda s: -sum(stages[s])):
+		t = sorted(stages[stage])
+		print("%-16s %8d %10.2f %9.1f %9.1f %9.1f %9.1f" % (stage, len(t), sum(t),
+			1000*percentile(t, 0.5), 1000*percentile(t, 0.9), 1000*percentile(t, 0.99), 1000*t[-1]))
+
+	print("\nslowest charts:")
+	for key in sorted(charts, key=lambda c: -charts[c])[:n_slowest]:
+		print("%9.1f ms  %s" % (1000*charts[key], key))
+
+
+if os.environ.get("NGS_METRICS") and _state["file"] is None:
+	enable(os.environ["NGS_METRICS"], truncate=False)
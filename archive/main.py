@@ -7,11 +7,17 @@ the file 'pass_locations.csv'
 """
 
 import os
-from undistort_field import *
 from pass_detection import *
 import json
-import scipy.misc
 import pandas as pd
+import argparse
+from parallel import imap_ordered
+from results import PassWriter
+from cache import ResultCache
+import instrument
+from output import csv_to_dataset
+from extract import pass_counts
+from denoise import parse_denoisers, denoise_tag
 
 def get_pass_data(data_file): 
 	"""
@@ -21,12 +27,7 @@ def get_pass_data(data_file):
 	with open(data_file) as _file: 
 		data = json.load(_file)
 		_file.close()
-	n_completions = data["completions"] - data["touchdowns"]
-	n_touchdowns = data["touchdowns"]
-	n_interceptions = data["interceptions"]
-	n_incompletes = data["attempts"] -  n_completions -  n_interceptions - n_touchdowns
-
-	return (n_completions, n_touchdowns, n_interceptions, n_incompletes)
+	return pass_counts(data)
 
 def get_image(folder, data_file):
 	"""
@@ -53,73 +54,165 @@ def get_game_data(data_file):
 	week = data_file.split(os.sep)[-3]
 	return (name, team, game_id, week)
 
-def write_pass_locations(image, data, passes):
+def detect_passes(image, data, scale=1, denoisers=None):
 	"""
-	Write player, team, and game information, and locations of all passes to a .csv file.
+	Extract the locations of all passes of one pass chart.
+	
+	Input:
+		image: path to the cleaned pass chart image, or None if there is no image
+		data: path to the data corresponding to the pass chart
+		scale: factor to reduce the image by for detection, with the centers refined on 
+			the full image
+		denoisers: dict of the denoise strategy of some pass types, as (name, params), 
+			instead of those of DEFAULT_DENOISE
+	Return:
+		pass_df: Pandas DataFrame with the pass_type, x and y of every pass
 	"""
 	(n_com, n_td, n_int, n_inc) = get_pass_data(data)
-	(name, team, game_id, week) = get_game_data(data)
+	denoisers = denoisers or {}
 	n_total = n_com + n_td + n_int + n_inc
 
 	pass_cols = ["pass_type", "x", "y"]
-	game_cols = ["game_id", "team", "week", "name"]
-	pass_df = pd.DataFrame(columns = pass_cols)
+	frames = []
 
 	if (image is None): 
-		rows_com = pd.DataFrame([["COMPLETE", None, None]]*n_com, 
-			columns = pass_cols)
-		rows_td = pd.DataFrame([["TOUCHDOWN", None, None]]*n_td, 
-			columns = pass_cols)
-		rows_int = pd.DataFrame([["INTERCEPTION", None, None]]*n_int, 
-			columns = pass_cols)
-		rows_inc = pd.DataFrame([["INCOMPLETE", None, None]]*n_inc, 
-			columns = pass_cols)
-		pass_df = pass_df.append([rows_com, rows_td, rows_int, rows_inc])
-		game_df = pd.DataFrame([[game_id, team, week, name]]*pass_df.shape[0], 
-			columns = game_cols)
-		df = pd.concat([game_df, pass_df.reset_index(drop=True)], axis=1)
-		passes = passes.append(df)
-		return passes
-
-	if n_com != 0: 
-		rows_com = completions(image, n_com)
-		pass_df = pass_df.append(rows_com)
-
-	if n_td != 0: 
-		rows_td = touchdowns(image, n_td)
-		pass_df = pass_df.append(rows_td)
-
-	if n_int != 0: 
-		rows_int = interceptions(image, n_int)
-		pass_df = pass_df.append(rows_int)
-
-	if n_inc != 0: 
-		rows_inc = incompletions(image, n_inc)
-		pass_df = pass_df.append(rows_inc)
-
-	game_df = pd.DataFrame([[game_id, team, week, name]]*pass_df.shape[0], 
-		columns = game_cols)
+		for (pass_type, n) in [("COMPLETE", n_com), ("TOUCHDOWN", n_td), 
+			("INTERCEPTION", n_int), ("INCOMPLETE", n_inc)]:
+			frames.append(map_pass_locations([], 0, pass_type, n))
 
-	df = pd.concat([game_df, pass_df.reset_index(drop=True)], axis=1)
-	passes = passes.append(df)
-	return passes
+	else:
+		# decode the image once and share it between the detectors
+		with instrument.timer("decode"):
+			chart = Chart.read(image).reduced(scale)
 
+		if n_com != 0: 
+			with instrument.timer("detect:COMPLETE"):
+				frames.append(completions(chart, n_com))
 
-if __name__ == '__main__':
+		if n_td != 0: 
+			with instrument.timer("detect:TOUCHDOWN"):
+				frames.append(touchdowns(chart, n_td, denoisers.get("TOUCHDOWN")))
 
-	clean_path = "Cleaned_Pass_Charts"
-	passes = pd.DataFrame(columns = ["game_id", "team", "week", "name", "pass_type", "x", "y"])
+		if n_int != 0: 
+			with instrument.timer("detect:INTERCEPTION"):
+				frames.append(interceptions(chart, n_int, denoisers.get("INTERCEPTION")))
+
+		if n_inc != 0: 
+			with instrument.timer("detect:INCOMPLETE"):
+				frames.append(incompletions(chart, n_inc, denoisers.get("INCOMPLETE")))
+
+	if len(frames) == 0:
+		frames.append(pd.DataFrame(columns = pass_cols))
+	return pd.concat(frames, ignore_index=True)
 
+def chart_pass_locations(image, data, cache=None, scale=1, denoisers=None):
+	"""
+	Extract player, team, and game information, and locations of all passes of one pass chart.
+	
+	Input:
+		image: path to the cleaned pass chart image, or None if there is no image
+		data: path to the data corresponding to the pass chart
+		cache: ResultCache of pass locations, keyed by the image, data, DETECTOR_VERSION, 
+			scale and the denoise strategy of every pass type
+		scale: factor to reduce the image by for detection, see detect_passes
+		denoisers: denoise strategies, see detect_passes
+	Return:
+		df: Pandas DataFrame with one row per pass
+	"""
+	(name, team, game_id, week) = get_game_data(data)
+	season = data.split(os.sep)[-4]
+	game_cols = ["game_id", "team", "week", "name", "season"]
+
+	if (cache is not None) and (image is not None):
+		version = DETECTOR_VERSION if scale == 1 else DETECTOR_VERSION + "/reduced%d" % scale
+		version += "/" + denoise_tag(denoisers)
+		key = cache.key(version, image, data)
+		pass_df = cache.get(key)
+		if pass_df is None:
+			pass_df = detect_passes(image, data, scale, denoisers)
+			cache.put(key, pass_df)
+	else:
+		pass_df = detect_passes(image, data, scale, denoisers)
+
+	game_df = pd.DataFrame([[game_id, team, week, name, season]]*pass_df.shape[0], 
+		columns = game_cols)
+
+	return pd.concat([game_df, pass_df], axis=1)
+
+def extract_chart(image, data, cache=None, scale=1, denoisers=None):
+	"""
+	Worker function for the main loop, returns the key of the chart with its pass locations.
+	"""
+	with instrument.chart(data):
+		return data, chart_pass_locations(image, data, cache, scale, denoisers)
+
+def write_pass_locations(image, data, passes):
+	"""
+	Write player, team, and game information, and locations of all passes to a .csv file.
+	"""
+	return pd.concat([passes, chart_pass_locations(image, data)])
+
+def pass_chart_jobs(clean_path):
+	"""
+	Generate the (image, data) pair of every pass chart in clean_path, in os.walk order.
+	"""
 	pass_chart_folders = [folder[0] for folder in os.walk(clean_path)]
 	data_folders = [folder for folder in pass_chart_folders if folder.split(os.sep)[-1] == "data"]
 
-	print("Extracting pass locations...")
 	for folder in data_folders:
 		data = os.listdir(folder)
 		print(folder)
 		for data_file in data:
 			if not data_file.startswith("."): 
 				image = get_image(folder, data_file)
-				passes = write_pass_locations(image, os.path.join(folder, data_file), passes)
-	passes.to_csv("pass_locations.csv", index=False, header=True)
+				yield (image, os.path.join(folder, data_file))
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Extract pass locations from cleaned pass charts')
+	parser.add_argument('-j', '--workers', type=int, dest='workers', default=1, 
+		help='number of worker processes')
+	parser.add_argument('--max-in-flight', type=int, dest='max_in_flight', default=None, 
+		help='maximum number of charts queued or in progress at once (default 2 x workers)')
+	parser.add_argument('--chunk-size', type=int, dest='chunk_size', default=50000, 
+		help='number of rows buffered before they are written out and checkpointed')
+	parser.add_argument('--resume', action='store_true', dest='resume', 
+		help='resume an interrupted run from its last checkpoint')
+	parser.add_argument('--cache', type=str, dest='cache', default="Extraction_Cache", 
+		help='folder of the cache of extracted pass locations')
+	parser.add_argument('--cache-size', type=int, dest='cache_size', default=1024, 
+		help='maximum size of the cache in MB')
+	parser.add_argument('--no-cache', action='store_const', const=None, dest='cache', 
+		help='extract every chart, without reading or writing the cache')
+	parser.add_argument('--scale', type=int, dest='scale', default=1, 
+		help='detect passes on the charts reduced by this factor, e.g. 2, refining the '
+		'locations on the full charts')
+	parser.add_argument('--denoise', nargs='+', type=str, dest='denoise', default=None, 
+		help='denoise strategy of a pass type as TYPE=NAME, e.g. INCOMPLETE=morphology, '
+		'see denoise.py')
+	parser.add_argument('--parquet', type=str, dest='parquet', default=None, 
+		help='also write a Parquet dataset partitioned by season, team and week to this folder')
+	parser.add_argument('--metrics', type=str, dest='metrics', default=None, 
+		help='record the time of every stage of every chart to this file, and print a summary')
+	args = parser.parse_args()
+	denoisers = parse_denoisers(args.denoise)
+	if args.metrics: instrument.enable(args.metrics)
+
+	clean_path = "Cleaned_Pass_Charts"
+	passes = PassWriter("pass_locations.csv", chunk_size=args.chunk_size, resume=args.resume)
+	cache = ResultCache(args.cache, args.cache_size*1024**2) if args.cache else None
+
+	print("Extracting pass locations...")
+	jobs = ((image, data, cache, args.scale, denoisers) for (image, data) in pass_chart_jobs(clean_path) 
+		if data not in passes.done)
+	for (data, df) in imap_ordered(extract_chart, jobs, args.workers, args.max_in_flight):
+		with instrument.chart(data), instrument.timer("accumulate"):
+			passes.add(data, df)
+	passes.close()
+	if cache is not None: cache.evict()
+	if args.parquet:
+		written = csv_to_dataset("pass_locations.csv", args.parquet)
+		print("Wrote", len(written), "changed partitions to", args.parquet)
 	print("Done.")
+	if args.metrics: instrument.summary(args.metrics)
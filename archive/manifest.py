@@ -0,0 +1,97 @@
+"""
+Download manifest of the scraper. For every listing page and chart image it records the URL,
+the SHA-256 of the content and the ETag/Last-Modified validators sent by the server, so that
+reruns can skip charts that haven't changed and use conditional requests for the rest.
+
+The manifest is an append-only file of JSON lines, one per update, which is flushed as the
+crawl goes so that an interrupted crawl can resume where it stopped. Later lines win, and the
+file is rewritten with one line per key when the manifest is closed.
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+
+def sha256(content):
+	"""
+	Hex SHA-256 of bytes or of a str, encoded as UTF-8.
+	"""
+	if isinstance(content, str):
+		content = content.encode("utf-8")
+	return hashlib.sha256(content).hexdigest()
+
+def file_sha256(path):
+	"""
+	Hex SHA-256 of the contents of the file at path, or None if it doesn't exist.
+	"""
+	if not os.path.exists(path):
+		return None
+	with open(path, "rb") as _file:
+		return sha256(_file.read())
+
+
+class Manifest(object):
+	"""
+	Thread safe record of downloaded pages and charts.
+
+	Input:
+		path: path of the manifest file, created if it doesn't exist
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self.entries = {}
+		self._lock = threading.Lock()
+
+		if os.path.exists(path):
+			with open(path) as _file:
+				for line in _file:
+					try:
+						record = json.loads(line)
+					except ValueError:
+						# partial last line of an interrupted crawl
+						continue
+					self.entries[record.pop("key")] = record
+
+		folder = os.path.dirname(path)
+		if folder: os.makedirs(folder, exist_ok=True)
+		self._file = open(path, "a")
+
+	def get(self, key):
+		return self.entries.get(key)
+
+	def update(self, key, **entry):
+		"""
+		Record entry for key, and append it to the manifest file.
+		"""
+		line = json.dumps(dict(entry, key=key))
+		with self._lock:
+			self.entries[key] = entry
+			self._file.write(line + "\n")
+			self._file.flush()
+
+	def conditional_headers(self, key):
+		"""
+		Headers that make a GET of key return 304 Not Modified if it hasn't changed.
+		"""
+		entry = self.entries.get(key) or {}
+		headers = {}
+		if entry.get("etag"):
+			headers["If-None-Match"] = entry["etag"]
+		if entry.get("last_modified"):
+			headers["If-Modified-Since"] = entry["last_modified"]
+		return headers
+
+	def close(self):
+		"""
+		Rewrite the manifest file with only the latest entry of every key.
+		"""
+		with self._lock:
+			self._file.close()
+			temp = self.path + ".tmp"
+			with open(temp, "w") as _file:
+				for key in sorted(self.entries):
+					_file.write(json.dumps(dict(self.entries[key], key=key)) + "\n")
+			os.replace(temp, self.path)
@@ -0,0 +1,125 @@
+"""
+Partitioned columnar output of the pass locations, written alongside pass_locations.csv.
+
+The pass locations are written as a Parquet dataset with one partition per season, team and
+week, in the hive layout '[root]/season=[season]/team=[team]/week=[week]/part-0.parquet'.
+name and pass_type are dictionary encoded and the coordinates are float32. A hash of every
+partition is kept in '[root]/_partitions.json', and only partitions whose rows changed are
+written, so appending a new week only writes the new partition.
+
+Requires pyarrow (pip install pyarrow).
+"""
+
+import os
+import json
+import hashlib
+import pandas as pd
+
+PARTITION_COLUMNS = ["season", "team", "week"]
+
+
+def _pyarrow():
+	try:
+		import pyarrow
+		import pyarrow.parquet
+	except ImportError:
+		raise ImportError("Parquet output requires pyarrow: pip install pyarrow")
+	return pyarrow
+
+def to_table(df):
+	"""
+	Function to convert the rows of a partition to an Arrow table, without the partition
+	columns.
+
+	Input:
+		df: Pandas DataFrame of pass locations
+	Return:
+		table: pyarrow.Table with int64 game_id, dictionary encoded name and pass_type,
+			and float32 x and y
+	"""
+	pa = _pyarrow()
+	schema = pa.schema([
+		("game_id", pa.int64()),
+		("name", pa.dictionary(pa.int32(), pa.string())),
+		("pass_type", pa.dictionary(pa.int8(), pa.string())),
+		("x", pa.float32()),
+		("y", pa.float32()),
+	])
+	columns = {
+		"game_id": pd.to_numeric(df["game_id"], errors="coerce").astype("Int64"),
+		"name": df["name"].astype(str).astype("category"),
+		"pass_type": df["pass_type"].astype(str).astype("category"),
+		"x": df["x"].astype("float32"),
+		"y": df["y"].astype("float32"),
+	}
+	return pa.Table.from_pandas(pd.DataFrame(columns), schema=schema, preserve_index=False)
+
+def partition_path(root, key):
+	"""
+	Folder of the partition of key = (season, team, week).
+	"""
+	return os.path.join(root, *["%s=%s" % (c, v) for (c, v) in zip(PARTITION_COLUMNS, key)])
+
+def write_partitions(df, root):
+	"""
+	Function to write the pass locations in df to the partitions of the dataset in root,
+	replacing the partitions of df, but skipping those whose rows haven't changed.
+
+	Input:
+		df: Pandas DataFrame of pass locations, with season, team and week columns
+		root: root folder of the dataset
+	Return:
+		written: list of the (season, team, week) partitions that were written
+	"""
+	pq = _pyarrow().parquet
+	os.makedirs(root, exist_ok=True)
+	index_file = os.path.join(root, "_partitions.json")
+	index = {}
+	if os.path.exists(index_file):
+		with open(index_file) as _file:
+			index = json.load(_file)
+
+	written = []
+	for (key, part) in df.groupby([df[c].astype(str) for c in PARTITION_COLUMNS], sort=False):
+		folder = partition_path(root, key)
+		name = os.path.relpath(folder, root)
+		part = part.drop(columns = PARTITION_COLUMNS)
+
+		digest = hashlib.sha256(pd.util.hash_pandas_object(part.astype(str),
+			index=False).values.tobytes()).hexdigest()
+		if index.get(name) == digest and os.path.exists(os.path.join(folder, "part-0.parquet")):
+			continue
+
+		os.makedirs(folder, exist_ok=True)
+		temp = os.path.join(folder, "part-0.parquet.tmp")
+		pq.write_table(to_table(part), temp)
+		os.replace(temp, os.path.join(folder, "part-0.parquet"))
+		index[name] = digest
+		written.append(key)
+
+	temp = index_file + ".tmp"
+	with open(temp, "w") as _file:
+		json.dump(index, _file, indent=0, sort_keys=True)
+	os.replace(temp, index_file)
+	return written
+
+def csv_to_dataset(csv_file, root):
+	"""
+	Function to write a pass locations .csv file, such as the output of main.py, to the
+	partitioned dataset in root.
+	"""
+	df = pd.read_csv(csv_file, dtype={"season": str, "team": str, "week": str})
+	return write_partitions(df, root)
+
+def read_dataset(root, filters=None):
+	"""
+	Function to read the dataset in root into a Pandas DataFrame.
+
+	Input:
+		root: root folder of the dataset
+		filters: optional pyarrow filters on the partition values, with teams as the slugs of
+			scrape.teams, e.g. [("season", "=", 2020), ("team", "=", "kansas-city-chiefs")],
+			which only read the matching partitions
+	"""
+	pq = _pyarrow().parquet
+	return pq.read_table(root, partitioning="hive", filters=filters).to_pandas()
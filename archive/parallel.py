@@ -0,0 +1,38 @@
+"""
+Run a function over a sequence of jobs on a pool of worker processes, and yield 
+the results in the same order as the jobs, as a serial run would.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def imap_ordered(fn, jobs, workers=1, max_in_flight=None):
+	"""
+	Function to map fn over jobs, in parallel if workers > 1.
+	
+	Input:
+		fn: function to apply to each job, defined at module level so it can be pickled
+		jobs: iterable of tuples of arguments to fn
+		workers: number of worker processes, or 1 to run in this process
+		max_in_flight: maximum number of jobs submitted but not yet yielded, which bounds 
+			how many images and results are held in memory at once (default 2*workers)
+	Return:
+		generator of fn(*job) for every job, in the order of jobs
+	"""
+	if workers <= 1:
+		for job in jobs:
+			yield fn(*job)
+		return
+
+	if max_in_flight is None:
+		max_in_flight = 2*workers
+
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		pending = deque()
+		for job in jobs:
+			pending.append(pool.submit(fn, *job))
+			if len(pending) >= max_in_flight:
+				yield pending.popleft().result()
+		while pending:
+			yield pending.popleft().result()
@@ -6,36 +6,32 @@ incomplete passes, interceptions, and touchdowns relative to the line of scrimma
 
 import cv2
 import numpy as np
-from PIL import Image
-from sklearn.cluster import DBSCAN
-from sklearn.cluster import KMeans
 from collections import Counter
-import pandas as pd
-import math
-import os
-import scipy.misc
+from chart import Chart, as_chart
+from denoise import denoise
+import instrument
 
+# version tag of the detectors, change it whenever a change to the detectors changes their
+# output, so that results cached by main.py are extracted again
+DETECTOR_VERSION = "5"
 
-def map_pass_locations(centers, col, pass_type, n_empty = 0):
-    """
-    Function to map pixel location of passes to real field location of passes,
-    with the y-axis at the center of the field, and the x-axis at the line of scrimmage.
-    All images show either 55 yards or 75 yards in front of the line of scrimmage,
-    10 yards behind the line of scrimmage, and a standard field width of 53.33 yards.
-    
-    Input:
-        centers: list of pass locations in pixels
-        col: width of image from which the pass locations were extracted
-        pass_type: "COMPLETE", "INCOMPLETE", "INTERCEPTION", or "TOUCHDOWN"
-    Return:
-        pass_locations: Pandas DataFrame of all pass locations on the field and pass type
-    """
+# components of a color mask smaller than this fraction of the median component area are noise
+NOISE_FRACTION = 0.25
 
-    col_names = ["pass_type", "x", "y"]
-    pass_locations = pd.DataFrame(columns = col_names)
+# pandas and scikit-learn are imported by the functions that use them, so that worker
+# processes and scripts that only import this module start quickly
 
-    if ((len(centers) == 0) and (n_empty == 0)): return pass_locations
 
+def field_scale(col):
+    """
+    Function to get the pixel scale of a cleaned chart of width col, which shows either
+    55 yards or 75 yards in front of the line of scrimmage and a field width of 53.33 yards.
+
+    Return:
+        center_x: column of the center of the field
+        LOS: row of the line of scrimmage
+        _1_yd_x, _1_yd_y: pixels per yard across and along the field
+    """
     sideline = 40 # pixels
     width = 53.33 # standard width of football field
     center_x = col/2
@@ -53,27 +49,123 @@ def map_pass_locations(centers, col, pass_type, n_empty = 0):
         _1_yd_x = float(col - sideline*2)/width
         _1_yd_y = float(LOS - _55_yd_line)/55
 
-    for c in centers:
-        y = c[0]
-        x = c[1]
-        y_loc = float(LOS - y)/_1_yd_y
-        x_loc = float(x - center_x)/_1_yd_x
-        df = pd.DataFrame([[pass_type, x_loc, y_loc]], columns = col_names)
-        pass_locations = pass_locations.append(df, ignore_index=True)
-
-    if (n_empty != 0):
-        df = pd.DataFrame([[pass_type, None, None]]*n_empty, 
-            columns = col_names)
-        pass_locations = pass_locations.append(df, ignore_index=True)
+    return center_x, LOS, _1_yd_x, _1_yd_y
+
+def map_pass_locations(centers, col, pass_type, n_empty = 0):
+    """
+    Function to map pixel location of passes to real field location of passes,
+    with the y-axis at the center of the field, and the x-axis at the line of scrimmage.
+    All images show either 55 yards or 75 yards in front of the line of scrimmage,
+    10 yards behind the line of scrimmage, and a standard field width of 53.33 yards.
+    
+    Input:
+        centers: list of pass locations in pixels
+        col: width of image from which the pass locations were extracted
+        pass_type: "COMPLETE", "INCOMPLETE", "INTERCEPTION", or "TOUCHDOWN"
+        n_empty: number of passes of pass_type that couldn't be located
+    Return:
+        pass_locations: Pandas DataFrame of all pass locations on the field and pass type
+    """
+
+    import pandas as pd
+
+    col_names = ["pass_type", "x", "y"]
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    center_x, LOS, _1_yd_x, _1_yd_y = field_scale(col)
+
+    # centers are (row, column) pixels; passes that couldn't be located are NaN
+    y_loc = np.append((LOS - centers[:,0])/_1_yd_y, np.full(n_empty, np.nan))
+    x_loc = np.append((centers[:,1] - center_x)/_1_yd_x, np.full(n_empty, np.nan))
+
+    pass_locations = pd.DataFrame({"pass_type": np.full(len(x_loc), pass_type, dtype=object),
+        "x": x_loc, "y": y_loc}, columns = col_names)
     return pass_locations
 
+def _axis_seeds(points, k):
+    """
+    Function to get k initial centers spread along the major axis of a blob of
+    pixels, from its mean and second order central moments.
+    """
+    mean = points.mean(axis=0)
+    evals, evecs = np.linalg.eigh(np.cov(points.T))
+    axis = evecs[:, -1]*np.sqrt(max(evals[-1], 0))
+    return mean + np.linspace(-1, 1, k)[:, None]*axis
+
+def find_markers(mask, n):
+    """
+    Function to find the centers of n pass markers in a binary mask. Every connected 
+    component of the mask is a marker, except that components smaller than NOISE_FRACTION
+    of the median component area are dropped as noise, and then the smallest components if
+    there are still more than n. Components whose area shows overlapping markers are split
+    with k-means, seeded along the component's major axis.
+    
+    Input: 
+        mask: binary image, nonzero on pixels of the color of the markers
+        n: number of markers
+    Return:
+        centers: numpy.ndarray of up to n marker centers, as (row, column) pixels
+        points: numpy.ndarray of the (row, column) pixels belonging to the markers
+        labels: index of the center of every pixel in points
+    """
+    with instrument.timer("find_markers") as t:
+        centers, points, labels = _find_markers(mask, n)
+        t.set(pixels=len(points), clusters=len(centers))
+    return centers, points, labels
+
+def _find_markers(mask, n):
+    n_labels, components, stats, centroids = cv2.connectedComponentsWithStats(
+        (mask != 0).astype(np.uint8), connectivity=8)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+
+    # components much smaller than the typical component are noise, such as JPEG specks,
+    # and are dropped before any are kept as markers, so that a speck doesn't take the place
+    # of a marker that overlaps another one
+    candidates = np.arange(len(areas))
+    if len(areas) > 0:
+        candidates = np.flatnonzero(areas >= NOISE_FRACTION*np.median(areas))
+
+    # keep the n largest remaining components, as component labels
+    keep = candidates[np.argsort(-areas[candidates], kind="stable")[:n]] + 1
+    if len(keep) == 0:
+        return np.zeros((0, 2)), np.zeros((0, 2), dtype=int), np.zeros(0, dtype=int)
+
+    # one marker per component, then each remaining marker goes to the component
+    # with the largest area per marker
+    k = np.ones(len(keep), dtype=int)
+    for _ in range(n - len(keep)):
+        k[np.argmax(stats[keep, cv2.CC_STAT_AREA]/k)] += 1
+    k = np.minimum(k, stats[keep, cv2.CC_STAT_AREA])
+
+    index = np.full(n_labels, -1)
+    index[keep] = np.arange(len(keep))
+    rows, cols = np.nonzero(components)
+    comp = index[components[rows, cols]]
+    points = np.column_stack([rows, cols])[comp >= 0]
+    comp = comp[comp >= 0]
+
+    centers = []
+    labels = np.empty(len(points), dtype=int)
+    for i in range(len(keep)):
+        in_comp = (comp == i)
+        if k[i] == 1:
+            labels[in_comp] = len(centers)
+            centers.append(centroids[keep[i]][::-1])
+        else:
+            from sklearn.cluster import KMeans
+            blob = points[in_comp]
+            kmeans = KMeans(n_clusters=k[i], init=_axis_seeds(blob, k[i]), n_init=1).fit(blob)
+            labels[in_comp] = len(centers) + kmeans.labels_
+            centers.extend(kmeans.cluster_centers_)
+
+    return np.array(centers), points, labels
+
 def completions(image, n):
     """
     Function to obtain the locations of the complete passes from the image
-    of the pass chart using k-means.
+    of the pass chart using connected components.
     
     Input: 
-        image: image from the folder 'Cleaned_Pass_Charts'
+        image: Chart, or image from the folder 'Cleaned_Pass_Charts'
         n: number of incompletions, from the corresponding data of the image
     Return:
         call to map_pass_locations:
@@ -82,48 +174,38 @@ def completions(image, n):
             pass_type: "COMPLETE"
     """
 
-    image = cv2.imread(image)
-    row, col = image.shape[0:2]
-
-    # Convert BGR to HSV
-    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-
-    # define range of green color in HSV
-    lower_green = np.array([40,100, 100])
-    upper_green = np.array([80, 255, 255])
+    # completions are found on the full resolution chart, even if image is reduced, since 
+    # the split of overlapping markers found on a reduced chart can't be refined exactly, and
+    # masking the full chart costs little
+    chart = as_chart(image).full_resolution()
+    col = chart.col
 
     # Threshold the HSV image to get only green colors
-    mask = cv2.inRange(hsv, lower_green, upper_green)
+    mask = chart.mask("COMPLETE")
 
-    # Bitwise-AND mask and original image
-    res = cv2.bitwise_and(image, image, mask=mask)
-
-    x = np.where(res != 0)[0]
-    y = np.where(res != 0)[1]
-    pairs = list(zip(x,y))
-    X = list(map(list, pairs))
-
-    kmeans = KMeans(n_clusters=n, random_state=0).fit(X)
-    centers = kmeans.cluster_centers_
+    centers, X, labels = find_markers(mask, n)
 
-    return map_pass_locations(centers, col, "COMPLETE")
+    return map_pass_locations(centers, col, "COMPLETE", n - len(centers))
 
-def dist(x1, y1, x2, y2):
-    return math.hypot(x2 - x1, y2 - y1)**2
-
-def dist2(x1, y1, x2, y2):
-    return math.hypot(x2 - x1, y2 - y1)
+def _group_means(X, labels, n):
+    """
+    Function to get the mean of the points X of each of n labels.
+    """
+    counts = np.bincount(labels, minlength=n)
+    sums = np.column_stack([np.bincount(labels, weights=X[:, j], minlength=n) for j in (0, 1)])
+    return sums/counts[:, None]
 
-def incompletions(image, n):
+def incompletions(image, n, denoiser=None):
     """
     Function to obtain the locations of the incomplete passes from the image
-    of the pass chart using k-means, and DBSCAN to account for discrepancies
+    of the pass chart using connected components, and cluster quality to account for discrepancies
     in given number of incompletions from the data vs. number of incompletions
     shown on the field.
     
     Input: 
-        image: image from the folder 'Cleaned_Pass_Charts'
+        image: Chart, or image from the folder 'Cleaned_Pass_Charts'
         n: number of incompletions, from the corresponding data of the image
+        denoiser: (name, params) of the denoise strategy, or None for the default
     Return:
         call to map_pass_locations:
             centers: list of pass locations in pixels
@@ -131,69 +213,65 @@ def incompletions(image, n):
             pass_type: "INCOMPLETE"
     """
 
-    image = cv2.imread(image)
-    row, col = image.shape[0:2]
-
-    lower_white = np.array([230, 230, 230])
-    upper_white = np.array([255, 255, 255])
+    chart = as_chart(image)
+    image = chart.bgr
+    col = chart.col
+    # pixel distances of a reduced chart are smaller by its scale
+    s = chart.scale
 
-    mask = cv2.inRange(image, lower_white, upper_white)
+    mask = chart.mask("INCOMPLETE")
     res = cv2.bitwise_and(image, image, mask=mask)
-    res = cv2.fastNlMeansDenoisingColored(res)
+    res = denoise(res, "INCOMPLETE", denoiser)
 
-    x = np.where(res != 0)[0]
-    y = np.where(res != 0)[1]
-    pairs = list(zip(x,y))
-    X = np.array(list(map(list, pairs)))
+    mask = res.any(axis=2)
+    centers, X, labels = find_markers(mask, n)
+    n_found = len(centers)
 
-    kmeans = KMeans(n_clusters=n, random_state=0).fit(X)
-    centers = kmeans.cluster_centers_
+    if (n_found == 0):
+        return map_pass_locations([], col, "INCOMPLETE", n)
 
-    wcvs = np.zeros(n)
-    for i in range(n):
-        y = int(round(centers[i][0]))
-        x = int(round(centers[i][1]))
-        c_points = X[np.where(kmeans.labels_ == i)]
-        wcv = sum([dist(x, y, p[1], p[0]) for p in c_points])
-        wcvs[i] = wcv/len(c_points)
+    # within cluster variance: mean squared distance of each cluster's pixels to its rounded center
+    d2 = ((X - np.round(centers)[labels])**2).sum(axis=1)
+    wcvs = np.bincount(labels, weights=d2, minlength=n_found)/np.bincount(labels, minlength=n_found)
 
     mean_ = np.mean(wcvs)
     median_ = np.median(wcvs)
 
-    center = centers[centers[:,1].argsort()]
-    dists = np.zeros(n-1)
-    for j in range(n-1):
-        y1 = center[j][0]
-        x1 = center[j][1]
-        y2 = center[j+1][0]
-        x2 = center[j+1][1]
-
-        dists[j] = dist2(x1, y1, x2, y2)
-
-    close_i = np.argwhere(dists < 15)
-    new_n = n
-    for i in close_i:
-        c1 = np.where(centers == center[i])[0][0]
-        c2 = np.where(centers == center[i+1])[0][0]
-        if (mean_ < 30 and median_ < 30 and wcvs[c1] + wcvs[c2] < 45):
-            new_n -= 1
-        elif (wcvs[c1] + wcvs[c2] < 50):
-            new_n -= 1
-
-    kmeans = KMeans(n_clusters=new_n, random_state=0).fit(X)
-    centers = kmeans.cluster_centers_
+    # neighboring centers from left to right that are close together, with tight clusters,
+    # are a single incompletion that was split in two
+    order = centers[:,1].argsort()
+    dists = np.hypot(*np.diff(centers[order], axis=0).T)
+    pair_wcvs = wcvs[order[:-1]] + wcvs[order[1:]]
+    merge = (dists < 15/s) & (((mean_ < 30/s**2) & (median_ < 30/s**2) & (pair_wcvs < 45/s**2)) |
+        (pair_wcvs < 50/s**2))
+
+    # clusters joined by merges form one group, whose pixels start the refit
+    group = np.empty(n_found, dtype=int)
+    group[order] = np.concatenate([[0], np.cumsum(~merge)])
+    new_n = group.max() + 1
+
+    centers = _group_means(X, group[labels], new_n)
+
+    # single reassignment pass of the pixels to the merged centers
+    d2 = ((X[:, None, :] - centers[None, :, :])**2).sum(axis=2)
+    nearest = d2.argmin(axis=1)
+    if len(np.unique(nearest)) == new_n:
+        centers = _group_means(X, nearest, new_n)
+    centers = chart.refine(centers, "INCOMPLETE")
+
     n_empty = n - new_n
 
     return map_pass_locations(centers, col, "INCOMPLETE", n_empty)
  
-def interceptions(image, n):
+def interceptions(image, n, denoiser=None):
     """
     Function to obtain the locations of the intercepted passes from the image
-    of the pass chart using k-means.
+    of the pass chart using connected components.
     
     Input: 
-        image: image from the folder 'Cleaned_Pass_Charts'
+        image: Chart, or image from the folder 'Cleaned_Pass_Charts'
         n: number of interceptions, from the corresponding data of the image
+        denoiser: (name, params) of the denoise strategy, or None for the default
     Return:
         call to map_pass_locations:
             centers: list of pass locations in pixels
@@ -201,34 +279,23 @@ def interceptions(image, n):
             pass_type: "INTERCEPTION"
     """
 
-    image = cv2.imread(image)
-    row, col = image.shape[0:2]
-
-    # define range of red 
-    lower_red = np.array([0, 0, 150])
-    upper_red = np.array([30, 30, 255])
+    chart = as_chart(image)
+    image = chart.bgr
+    col = chart.col
 
-    mask = cv2.inRange(image, lower_red, upper_red)
+    # threshold the image to get only red colors
+    mask = chart.mask("INTERCEPTION")
 
     # Bitwise-AND mask and original image
     res = cv2.bitwise_and(image, image, mask=mask)
-    res = cv2.fastNlMeansDenoisingColored(res, h = 10)
+    res = denoise(res, "INTERCEPTION", denoiser)
 
-    x = np.where(res != 0)[0]
-    y = np.where(res != 0)[1]
-    pairs = list(zip(x,y))
+    centers, X, labels = find_markers(res.any(axis=2), n)
+    centers = chart.refine(centers, "INTERCEPTION")
 
-    if (len(pairs) == 0): 
-        return map_pass_locations([], col, "INTERCEPTION", n)
-
-    X = list(map(list, pairs))
+    return map_pass_locations(centers, col, "INTERCEPTION", n - len(centers))
 
-    kmeans = KMeans(n_clusters=n, random_state=0).fit(X)
-    centers = kmeans.cluster_centers_
-
-    return map_pass_locations(centers, col, "INTERCEPTION")
-
-def touchdowns(image, n):
+def touchdowns(image, n, denoiser=None):
     """
     Function to obtain the locations of the touchdown passes from the image
     of the pass chart using k-means, and DBSCAN to account for difficulties in 
@@ -236,8 +303,9 @@ def touchdowns(image, n):
     scrimmage and the attached touchdown trajectory lines. 
     
     Input: 
-        image: image from the folder 'Cleaned_Pass_Charts'
+        image: Chart, or image from the folder 'Cleaned_Pass_Charts'
         n: number of toucndowns, from the corresponding data of the image
+        denoiser: (name, params) of the denoise strategy, or None for the default
     Return:
         call to map_pass_locations:
             centers: list of pass locations in pixels
@@ -245,60 +313,42 @@ def touchdowns(image, n):
             pass_type: "TOUCHDOWN"
     """
 
-    im = Image.open(image)
-    pix = im.load()
-    col, row = im.size
-
-    img = Image.new('RGB', (col, row), 'black') 
-    p = img.load() 
-
-    for i in range(col):
-        for j in range(row):
-            r = pix[i,j][0]
-            g = pix[i,j][1]
-            b = pix[i,j][2]
-            if (col < 1370) and (j < row-105) and (j > row-111):
-                if (b > 2*g) and (b > 60): 
-                    p[i,j] = (0,0,0)
-            elif (col > 1370) and (j < row-81) and (j > row-86):
-                if (b > 2*g) and (b > 60): 
-                    p[i,j] = (0,0,0)
-            else: p[i,j] = pix[i,j]
-            r = p[i,j][0]
-            g = p[i,j][1]
-            b = p[i,j][2]
-            f = ((r-20)**2 + (g-80)**2+ (b-200)**2)**0.5
-            if f < 32 and b > 100: 
-                p[i,j] = (255, 255,0)
-
-    scipy.misc.imsave('temp.jpg', img)
-    imag = cv2.imread('temp.jpg')
-    os.remove('temp.jpg')
-    hsv = cv2.cvtColor(imag, cv2.COLOR_BGR2HSV)
-    lower = np.array([20,100, 100])
-    upper = np.array([30, 255, 255])
-    mask = cv2.inRange(hsv, lower, upper)
+    # touchdowns are found on the full resolution chart, even if image is reduced, since 
+    # reducing the chart blends the thin touchdown blue into the field, so that it is no
+    # longer recolored and the touchdowns are lost
+    chart = as_chart(image).full_resolution()
+
+    # image with the line of scrimmage removed and touchdowns recolored to yellow
+    imag = chart.td_bgr
+    col = chart.col
+
+    mask = chart.mask("TOUCHDOWN")
     res = cv2.bitwise_and(imag, imag, mask=mask)
     res = cv2.cvtColor(res, cv2.COLOR_HSV2RGB)
     res = cv2.cvtColor(res, cv2.COLOR_BGR2GRAY)
-    res = cv2.fastNlMeansDenoising(res, h = 10)
+    res = denoise(res, "TOUCHDOWN", denoiser)
     x = np.where(res != 0)[0]
     y = np.where(res != 0)[1]
     pairs = list(zip(x,y))
     X = list(map(list, pairs))
 
     if (len(pairs) != 0):
-        db = DBSCAN(eps=10, min_samples=n).fit(X)
-        labels = db.labels_
-        coords = pd.DataFrame([x, y, labels]).T
-        coords.columns = ['x', 'y','label']
-        clusters = Counter(labels).most_common(n)
-        td_labels = np.array([clust[0] for clust in clusters])
-        km_coords = coords.loc[coords['label'].isin(td_labels)]
-        km = list(map(list, zip(km_coords.iloc[:,0], km_coords.iloc[:,1])))
-
-        kmeans = KMeans(n_clusters=n, random_state=0).fit(km)
-        centers = kmeans.cluster_centers_ 
+        import pandas as pd
+        from sklearn.cluster import DBSCAN, KMeans
+
+        with instrument.timer("cluster:TOUCHDOWN") as t:
+            db = DBSCAN(eps=10, min_samples=n).fit(X)
+            labels = db.labels_
+            coords = pd.DataFrame([x, y, labels]).T
+            coords.columns = ['x', 'y','label']
+            clusters = Counter(labels).most_common(n)
+            td_labels = np.array([clust[0] for clust in clusters])
+            km_coords = coords.loc[coords['label'].isin(td_labels)]
+            km = list(map(list, zip(km_coords.iloc[:,0], km_coords.iloc[:,1])))
+
+            kmeans = KMeans(n_clusters=n, random_state=0).fit(km)
+            centers = kmeans.cluster_centers_ 
+            t.set(pixels=len(pairs), clusters=len(centers))
 
         return map_pass_locations(centers, col, "TOUCHDOWN")
         
@@ -0,0 +1,325 @@
+"""
+Single entry point that streams every pass chart through the stages of scrape.py, clean.py
+and main.py, instead of running them one after the other over the whole folder tree.
+
+Each stage has its own worker count, and the stages are connected by bounded queues:
+
+	list pages -> download charts -> clean images -> extract passes -> pass_locations.csv
+
+Listing and downloading run in threads, sharing one pool of HTTP connections, while cleaning
+and extraction run in their own pools of worker processes. The queues hold at most
+--queue-size charts each, so a slow stage holds back the stages before it instead of
+buffering the whole crawl, and the first pass locations are written while the crawl is still
+running. Pass locations are written in the order charts finish, not in folder order.
+
+Every run lists every page again, so that pass_locations.csv has the charts of every page,
+while images that haven't changed since they were downloaded aren't downloaded again.
+
+Usage:
+	python pipeline.py -s 2019 -w 1 2 --download-workers 8 --clean-workers 2 --extract-workers 4
+"""
+
+import os
+import queue
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import scrape
+import clean
+from main import extract_chart
+from denoise import parse_denoisers
+from fetch import Fetcher
+from manifest import Manifest, sha256
+from results import PassWriter
+from cache import ResultCache
+from output import csv_to_dataset
+import instrument
+
+# marks the end of the items of a queue
+_END = object()
+
+
+def run_stage(fn, inbox, outbox, workers, pool=None, args=(), errors=None):
+	"""
+	Function to start the worker threads of a stage, which apply fn to every item of inbox
+	and put the items of the list it returns on outbox.
+
+	Input:
+		fn: function of the stage, taking the tuple of an item as its arguments and returning
+			a list of the items to pass on, which may be empty. fn must be defined at module
+			level if it is run in a pool
+		inbox, outbox: queues of the input and output items of the stage
+		workers: number of worker threads
+		pool: if given, a pool of worker processes that fn is run in, one call per thread
+		args: arguments passed to fn after those of the item
+		errors: if given, a list that (function name, first field of the item, error) of 
+			every item that failed is appended to
+	Return:
+		threads: list of the started threads
+	"""
+	running = [workers]
+	lock = threading.Lock()
+
+	def work():
+		while True:
+			item = inbox.get()
+			if item is _END:
+				# put the end back for the other workers of the stage
+				inbox.put(_END)
+				break
+			try:
+				if pool is not None:
+					results = pool.submit(fn, *(item + args)).result()
+				else:
+					results = fn(*(item + args))
+			except Exception as e:
+				print(fn.__name__, item[0], 'is giving an error (' + str(e) + '). Skipping...')
+				if errors is not None:
+					errors.append((fn.__name__, str(item[0]), str(e)))
+				continue
+			for result in results:
+				outbox.put(result)
+
+		with lock:
+			running[0] -= 1
+			if running[0] == 0:
+				outbox.put(_END)
+
+	threads = [threading.Thread(target=work, daemon=True) for i in range(workers)]
+	for thread in threads:
+		thread.start()
+	return threads
+
+def clean_paths(img_file, clean_path=clean.clean_path):
+	"""
+	Paths of the cleaned image and data of a downloaded image, under a single level folder
+	such as 'Pass_Charts', as written by clean.py.
+	"""
+	folder, image = os.path.split(img_file)
+	name = image.split(".")[0]
+	clean_folder = clean_path + os.sep + os.sep.join(folder.split(os.sep)[1:-1])
+	return (clean_folder + os.sep + "images" + os.sep + name + ".jpeg",
+		clean_folder + os.sep + "data" + os.sep + name + ".txt")
+
+def clean_chart(img_file, changed, clean_path=clean.clean_path):
+	"""
+	Function to clean a downloaded pass chart and its data, as clean.py does.
+
+	Input:
+		img_file: path of the downloaded image
+		changed: False if the chart didn't change since it was last downloaded, in which
+			case a chart that is already cleaned isn't cleaned again
+		clean_path: root folder of the cleaned images and data
+	Return:
+		[(image, data)]: path of the cleaned image, or None if it couldn't be cleaned, and
+			path of the cleaned data
+	"""
+	(clean_image, clean_data) = clean_paths(img_file, clean_path)
+	if changed or not (os.path.exists(clean_image) and os.path.exists(clean_data)):
+		folder, image = os.path.split(img_file)
+		with instrument.chart(img_file):
+			clean_image = clean.new_image(img_file, clean_path)
+			clean_data = clean.new_data(folder, image, clean_path)
+	return [(clean_image, clean_data)]
+
+def extract_passes(image, data, cache=None, scale=1, denoisers=None):
+	"""
+	Function to extract the pass locations of a cleaned pass chart, as main.py does.
+	"""
+	return [extract_chart(image, data, cache, scale, denoisers)]
+
+def pipeline(teams, seasons, weeks, list_workers=4, download_workers=8, clean_workers=1,
+	extract_workers=1, queue_size=64, rate=None, retries=5, base_url=scrape.base_url,
+	incremental=True, out_file="pass_locations.csv", chunk_size=1000, resume=False, cache=None,
+	scale=1, writer=None, pages=None, errors=None, denoisers=None, pages_done=None):
+	"""
+	Function to scrape, clean and extract the pass locations of every pass chart of teams in
+	seasons and weeks, streaming each chart through the stages as soon as it is downloaded.
+
+	Input:
+		teams, seasons, weeks: lists of teams, seasons and weeks to scrape
+		list_workers, download_workers: number of listing pages and images downloading at once
+		clean_workers, extract_workers: number of worker processes cleaning and extracting
+		queue_size: maximum number of charts waiting between two stages
+		rate: maximum requests per second, or None for no limit
+		retries: number of times a failed request is retried, with exponential backoff
+		base_url: root URL of Next Gen Stats, or of a local stand-in server
+		incremental: if False, download every page and image again. If True, images are
+			requested conditionally, and so are listing pages if writer is given
+		out_file: output .csv file of the pass locations
+		chunk_size: number of rows buffered before they are written to out_file, kept small
+			so that rows show up while the crawl is running
+		resume: if True, continue the output of an interrupted run
+		cache: ResultCache of pass locations, or None
+		scale: factor to reduce the charts by for detection, see main.detect_passes
+		writer: if given, an object with the add, flush and done of PassWriter that the pass 
+			locations are written to instead of out_file, which is flushed but not closed. 
+			It must keep the charts of earlier runs, as the delta log of watch.py does, since
+			the charts of listing pages that haven't changed aren't listed again
+		pages: list of the (team, season, week) listing pages to scrape, instead of every 
+			combination of teams, seasons and weeks
+		errors: if given, a list that the errors of pages and charts that were skipped are 
+			appended to, see run_stage
+		denoisers: denoise strategies of the detectors, see main.detect_passes
+		pages_done: if given, a list that the URL of every listing page is appended to once
+			all of its charts are written
+	Return:
+		n_charts: number of charts whose pass locations were written
+	"""
+	out_path = "Pass_Charts"
+	fetcher = Fetcher(concurrency=list_workers + download_workers, rate=rate, retries=retries)
+	manifest = Manifest(out_path + os.sep + "manifest.jsonl")
+	conditional = manifest if incremental else None
+	# out_file is written from the start, or resumed from a run that was, so it needs the 
+	# charts of every page, even of pages recorded in the manifest by earlier runs. Only a 
+	# writer that keeps the charts of earlier runs can skip the pages that haven't changed
+	page_conditional = conditional if writer is not None else None
+	passes = writer or PassWriter(out_file, chunk_size=chunk_size, resume=resume)
+
+	# charts of each page left to download, with the response of the page and the keys of its
+	# charts. A page is recorded in the manifest once all of its charts are written, so that
+	# a page with a chart that failed to download, clean or extract is listed again
+	remaining = {}
+	lock = threading.Lock()
+
+	def page_done(URL, r):
+		manifest.update(URL, etag=r.headers.get("ETag"),
+			last_modified=r.headers.get("Last-Modified"), sha256=sha256(r.content))
+
+	def list_page(team, season, week):
+		(charts, r) = scrape.get_charts(fetcher, team, season, week, base_url, page_conditional)
+		if charts is None:
+			return []
+		print(team, "\t", season, "\t", week, "\t", len(charts))
+		URL = scrape.list_url(team, season, week, base_url)
+		with lock:
+			remaining[URL] = [len(charts), r, set()]
+		return [(URL, chart, team, season, week) for chart in charts]
+
+	def download(URL, chart, team, season, week):
+		try:
+			(img_file, changed) = scrape.save_chart(fetcher, chart, team, season, week,
+				base_url, out_path, conditional)
+		except Exception:
+			with lock:
+				remaining[URL][0] = None
+			raise
+		with lock:
+			if remaining[URL][0] is not None:
+				remaining[URL][0] -= 1
+				remaining[URL][2].add(clean_paths(img_file)[1])
+
+		# charts already written by the interrupted run are neither cleaned nor extracted
+		if (not changed) and (clean_paths(img_file)[1] in passes.done):
+			return []
+		return [(img_file, changed)]
+
+	def record_pages():
+		with lock:
+			written = [URL for (URL, (n, r, keys)) in remaining.items() 
+				if (n == 0) and (keys <= passes.done)]
+			for URL in written:
+				page_done(URL, remaining.pop(URL)[1])
+				if pages_done is not None:
+					pages_done.append(URL)
+
+	if pages is None:
+		pages = [(team, season, week) for team in teams for season in seasons for week in weeks]
+	page_queue = queue.Queue()
+	charts, downloaded, cleaned, extracted = [queue.Queue(maxsize=queue_size) for i in range(4)]
+	for page in pages:
+		page_queue.put(tuple(page))
+	page_queue.put(_END)
+
+	clean_pool = ProcessPoolExecutor(max_workers=clean_workers)
+	extract_pool = ProcessPoolExecutor(max_workers=extract_workers)
+	run_stage(list_page, page_queue, charts, list_workers, errors=errors)
+	run_stage(download, charts, downloaded, download_workers, errors=errors)
+	run_stage(clean_chart, downloaded, cleaned, clean_workers, clean_pool, errors=errors)
+	run_stage(extract_passes, cleaned, extracted, extract_workers, extract_pool,
+		(cache, scale, denoisers), errors=errors)
+
+	n_charts = 0
+	while True:
+		item = extracted.get()
+		if item is _END:
+			break
+		(data, df) = item
+		with instrument.chart(data), instrument.timer("accumulate"):
+			passes.add(data, df)
+			record_pages()
+		n_charts += 1
+
+	if writer is None:
+		passes.close()
+	else:
+		passes.flush()
+	record_pages()
+	clean_pool.shutdown()
+	extract_pool.shutdown()
+	fetcher.close()
+	manifest.close()
+	return n_charts
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Scrape, clean and extract pass charts in one streaming run')
+	parser.add_argument('-s', '--seasons', nargs='+', type=str, dest='seasons', default=scrape.seasons, help='input season')
+	parser.add_argument('-t', '--teams', nargs='+', type=str, dest='teams', default=scrape.teams, help='input team')
+	parser.add_argument('-w', '--weeks', nargs='+', type=str, dest='weeks', default=scrape.weeks, help='input week')
+	parser.add_argument('--list-workers', type=int, dest='list_workers', default=4,
+		help='number of listing pages downloading at once')
+	parser.add_argument('--download-workers', type=int, dest='download_workers', default=8,
+		help='number of images downloading at once')
+	parser.add_argument('--clean-workers', type=int, dest='clean_workers', default=1,
+		help='number of worker processes cleaning images')
+	parser.add_argument('--extract-workers', type=int, dest='extract_workers', default=1,
+		help='number of worker processes extracting pass locations')
+	parser.add_argument('--queue-size', type=int, dest='queue_size', default=64,
+		help='maximum number of charts waiting between two stages')
+	parser.add_argument('--chunk-size', type=int, dest='chunk_size', default=1000,
+		help='number of rows buffered before they are written out and checkpointed')
+	parser.add_argument('-r', '--rate', type=float, dest='rate', default=None,
+		help='maximum requests per second')
+	parser.add_argument('--retries', type=int, dest='retries', default=5,
+		help='number of retries of a failed request')
+	parser.add_argument('--base-url', type=str, dest='base_url', default=scrape.base_url,
+		help='root URL to scrape, e.g. a local test server')
+	parser.add_argument('--full', action='store_false', dest='incremental',
+		help='download every page and image again, ignoring the manifest')
+	parser.add_argument('--resume', action='store_true', dest='resume',
+		help='resume an interrupted run from its last checkpoint')
+	parser.add_argument('--cache', type=str, dest='cache', default="Extraction_Cache",
+		help='folder of the cache of extracted pass locations')
+	parser.add_argument('--cache-size', type=int, dest='cache_size', default=1024,
+		help='maximum size of the cache in MB')
+	parser.add_argument('--no-cache', action='store_const', const=None, dest='cache',
+		help='extract every chart, without reading or writing the cache')
+	parser.add_argument('--scale', type=int, dest='scale', default=1,
+		help='detect passes on the charts reduced by this factor, e.g. 2, refining the '
+		'locations on the full charts')
+	parser.add_argument('--denoise', nargs='+', type=str, dest='denoise', default=None,
+		help='denoise strategy of a pass type as TYPE=NAME, e.g. INCOMPLETE=morphology, '
+		'see denoise.py')
+	parser.add_argument('--parquet', type=str, dest='parquet', default=None,
+		help='also write a Parquet dataset partitioned by season, team and week to this folder')
+	parser.add_argument('--metrics', type=str, dest='metrics', default=None,
+		help='record the time of every stage of every chart to this file, and print a summary')
+	args = parser.parse_args()
+	if args.metrics: instrument.enable(args.metrics)
+
+	cache = ResultCache(args.cache, args.cache_size*1024**2) if args.cache else None
+
+	print("Scraping, cleaning and extracting pass charts...")
+	n_charts = pipeline(args.teams, args.seasons, args.weeks, args.list_workers,
+		args.download_workers, args.clean_workers, args.extract_workers, args.queue_size,
+		args.rate, args.retries, args.base_url, args.incremental, chunk_size=args.chunk_size,
+		resume=args.resume, cache=cache, scale=args.scale,
+		denoisers=parse_denoisers(args.denoise))
+	print(n_charts, "charts extracted")
+	if cache is not None: cache.evict()
+	if args.parquet:
+		written = csv_to_dataset("pass_locations.csv", args.parquet)
+		print("Wrote", len(written), "changed partitions to", args.parquet)
+	print("Done.")
+	if args.metrics: instrument.summary(args.metrics)
@@ -0,0 +1,109 @@
+"""
+Columnar buffer for the pass locations extracted by main.py. Rows are held as one array
+per column, appended to the output .csv file a chunk at a time, and a checkpoint is
+written after every chunk so that an interrupted run can resume where it stopped.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+
+PASS_COLUMNS = ["game_id", "team", "week", "name", "pass_type", "x", "y", "season"]
+
+
+class PassWriter(object):
+	"""
+	Stream pass locations to a .csv file in chunks.
+
+	Input:
+		path: path of the output .csv file
+		chunk_size: number of buffered rows that triggers a write to path
+		resume: if True and a checkpoint exists, continue the output of the interrupted run
+		columns: columns of the output, in order
+	"""
+
+	def __init__(self, path, chunk_size=50000, resume=False, columns=PASS_COLUMNS):
+		self.path = path
+		self.checkpoint = path + ".checkpoint"
+		self.chunk_size = chunk_size
+		self.columns = columns
+
+		# keys of the charts whose rows are in the output file
+		self.done = set()
+		self.rows = 0
+
+		self._clear()
+		if resume and os.path.exists(self.checkpoint) and os.path.exists(path):
+			self._restore()
+		else:
+			# a checkpoint of an earlier run doesn't describe the new file
+			if os.path.exists(self.checkpoint):
+				os.remove(self.checkpoint)
+			pd.DataFrame(columns = columns).to_csv(path, index=False, header=True)
+
+	def _clear(self):
+		self._buffer = {c: [] for c in self.columns}
+		self._pending = []
+		self._n_buffered = 0
+
+	def _restore(self):
+		with open(self.checkpoint) as _file:
+			state = json.load(_file)
+		if state["offset"] > os.path.getsize(self.path):
+			raise RuntimeError("checkpoint %s is past the end of %s, which was rewritten "
+				"after it, run again without resume" % (self.checkpoint, self.path))
+
+		# drop anything written after the last checkpoint
+		with open(self.path, "r+b") as _file:
+			_file.truncate(state["offset"])
+
+		self.done = set(state["done"])
+		self.rows = state["rows"]
+
+	def add(self, key, df):
+		"""
+		Buffer the rows of one chart, and write them out if the buffer is full.
+
+		Input:
+			key: unique key of the chart, such as the path of its data file
+			df: Pandas DataFrame with the output columns
+		"""
+		for c in self.columns:
+			self._buffer[c].append(np.asarray(df[c].values))
+		self._pending.append(key)
+		self._n_buffered += len(df)
+
+		if self._n_buffered >= self.chunk_size:
+			self.flush()
+
+	def flush(self):
+		"""
+		Append the buffered rows to the output file and write a checkpoint.
+		"""
+		if len(self._pending) == 0:
+			return
+
+		chunk = pd.DataFrame({c: np.concatenate(self._buffer[c]) for c in self.columns},
+			columns = self.columns)
+		chunk.to_csv(self.path, mode="a", index=False, header=False)
+
+		self.done.update(self._pending)
+		self.rows += self._n_buffered
+		self._clear()
+
+		state = {"offset": os.path.getsize(self.path), "rows": self.rows,
+			"done": sorted(self.done)}
+		temp = self.checkpoint + ".tmp"
+		with open(temp, "w") as _file:
+			json.dump(state, _file)
+		os.replace(temp, self.checkpoint)
+
+	def close(self):
+		"""
+		Write any remaining rows, and remove the checkpoint of the finished run.
+		"""
+		self.flush()
+		if os.path.exists(self.checkpoint):
+			os.remove(self.checkpoint)
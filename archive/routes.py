@@ -0,0 +1,258 @@
+"""
+For every route chart image in 'Cleaned_Route_Charts', extract the routes of completions,
+yards after the catch, and incompletions as polylines in yards from the line of scrimmage,
+with the same field scale as the pass locations of map_pass_locations.
+
+The pixels of each route color are thinned to a one pixel wide skeleton, traced into ordered
+paths, mapped to yards with a single affine transform, and simplified to polylines whose
+points are within a tolerance in yards of the traced path. Instead of one table row per route
+pixel, the routes of every chart are stored as one float32 array of points and an array of
+offsets into it:
+
+	[out_path]/points.npy		float32 (n points, 2) x, y in yards
+	[out_path]/offsets.npy		int64, the points of route i are points[offsets[i]:offsets[i+1]]
+	[out_path]/route_type.npy	int8 index into ROUTE_TYPES of every route
+	[out_path]/chart.npy		int32 index into charts.csv of the chart of every route
+	[out_path]/charts.csv		game_id, team, week, name, position and season of every chart
+
+Usage:
+	python routes.py -s 2019 -j 4 --tolerance 0.25
+"""
+
+import os
+import json
+import argparse
+import cv2
+import numpy as np
+import pandas as pd
+from skimage.morphology import skeletonize
+from pass_detection import field_scale
+from parallel import imap_ordered
+
+# color ranges of each route type, as (color space, lower, upper)
+ROUTE_COLORS = {
+    "COMPLETE": ("bgr", np.array([230, 230, 230]), np.array([255, 255, 255])),
+    "YAC": ("hsv", np.array([40, 100, 100]), np.array([80, 255, 255])),
+    "INCOMPLETE": ("bgr", np.array([126, 126, 126]), np.array([132, 132, 132])),
+}
+ROUTE_TYPES = ["COMPLETE", "YAC", "INCOMPLETE"]
+
+CHART_COLUMNS = ["game_id", "team", "week", "name", "position", "season"]
+
+# 8-connected neighbours of a pixel
+_NEIGHBOURS = np.array([[1, 1, 1], [1, 0, 1], [1, 1, 1]], dtype=np.float32)
+
+
+def route_transform(col):
+    """
+    Function to get the affine transform from (column, row) pixels of a cleaned chart of
+    width col to (x, y) yards, with the same scale as map_pass_locations.
+
+    Return:
+        A: 2 x 3 numpy.ndarray, (x, y) = A @ (column, row, 1)
+    """
+    center_x, LOS, _1_yd_x, _1_yd_y = field_scale(col)
+    return np.array([[1/_1_yd_x, 0, -center_x/_1_yd_x],
+        [0, -1/_1_yd_y, LOS/_1_yd_y]], dtype=np.float32)
+
+def trace_skeleton(skeleton, min_pixels=5):
+    """
+    Function to trace a one pixel wide skeleton into ordered paths of pixels.
+
+    Each 8-connected part of the skeleton is followed along its outer contour. A part with
+    two ends is a single path, which the contour walks out and back, so only the walk from
+    one end to the other is kept; a branched part keeps the whole walk around it.
+
+    Input:
+        skeleton: binary image, nonzero on the skeleton
+        min_pixels: parts with fewer pixels than this are dropped as noise
+    Return:
+        paths: list of numpy.ndarray of (column, row) pixels, in order along the path
+    """
+    skeleton = (skeleton != 0).astype(np.uint8)
+    n_neighbours = cv2.filter2D(skeleton, cv2.CV_8U, _NEIGHBOURS,
+        borderType=cv2.BORDER_CONSTANT)
+    contours = cv2.findContours(skeleton, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)[-2]
+
+    paths = []
+    for contour in contours:
+        contour = contour.reshape(-1, 2)
+        if len(contour) < min_pixels:
+            continue
+        ends = np.flatnonzero(n_neighbours[contour[:, 1], contour[:, 0]] == 1)
+        if len(ends) == 2:
+            contour = contour[ends[0]:ends[1] + 1]
+        paths.append(contour)
+    return paths
+
+def chart_routes(image, tolerance=0.25):
+    """
+    Function to extract the routes of one route chart as polylines.
+
+    Input:
+        image: cleaned route chart, as a path or a numpy.ndarray in BGR order
+        tolerance: maximum distance in yards of the traced route from its polyline
+    Return:
+        routes: list of (route type, float32 numpy.ndarray of (x, y) points in yards)
+    """
+    if isinstance(image, str):
+        image = cv2.imread(image)
+    A = route_transform(image.shape[1])
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+
+    routes = []
+    for route_type in ROUTE_TYPES:
+        space, lower, upper = ROUTE_COLORS[route_type]
+        mask = cv2.inRange(hsv if space == "hsv" else image, lower, upper)
+        skeleton = skeletonize(mask != 0)
+        for path in trace_skeleton(skeleton):
+            yards = cv2.transform(path.reshape(-1, 1, 2).astype(np.float32), A)
+            line = cv2.approxPolyDP(yards, tolerance, False).reshape(-1, 2)
+            routes.append((route_type, line.astype(np.float32)))
+    return routes
+
+
+class RouteSet(object):
+    """
+    Routes of many charts, stored as one array of points and offsets into it.
+
+    Input:
+        points: float32 numpy.ndarray of (x, y) points in yards
+        offsets: int64 numpy.ndarray, the points of route i are points[offsets[i]:offsets[i+1]]
+        route_type: int8 index into ROUTE_TYPES of every route
+        chart: int32 index into charts of the chart of every route, in increasing order
+        charts: Pandas DataFrame with the CHART_COLUMNS of every chart
+    """
+
+    def __init__(self, points, offsets, route_type, chart, charts):
+        self.points = points
+        self.offsets = offsets
+        self.route_type = route_type
+        self.chart = chart
+        self.charts = charts
+
+    def __len__(self):
+        return len(self.route_type)
+
+    @classmethod
+    def from_charts(cls, charts):
+        """
+        Build a RouteSet from a list of (chart information, routes), where chart information
+        is a dict with CHART_COLUMNS and routes is a list returned by chart_routes.
+        """
+        lines = [line for (info, routes) in charts for (route_type, line) in routes]
+        lengths = np.array([len(line) for line in lines], dtype=np.int64)
+        points = np.concatenate(lines).astype(np.float32) if lines else np.zeros((0, 2), np.float32)
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        route_type = np.array([ROUTE_TYPES.index(route_type) for (info, routes) in charts
+            for (route_type, line) in routes], dtype=np.int8)
+        chart = np.repeat(np.arange(len(charts), dtype=np.int32),
+            [len(routes) for (info, routes) in charts])
+        info = pd.DataFrame([info for (info, routes) in charts], columns = CHART_COLUMNS)
+        return cls(points, offsets, route_type, chart, info)
+
+    def save(self, out_path):
+        """
+        Write the routes to the folder out_path.
+        """
+        os.makedirs(out_path, exist_ok=True)
+        for name in ["points", "offsets", "route_type", "chart"]:
+            np.save(os.path.join(out_path, name + ".npy"), getattr(self, name))
+        self.charts.to_csv(os.path.join(out_path, "charts.csv"), index=False)
+
+    @classmethod
+    def load(cls, out_path, mmap=True):
+        """
+        Read routes written by save, memory mapping the arrays if mmap is True.
+        """
+        mode = "r" if mmap else None
+        arrays = [np.load(os.path.join(out_path, name + ".npy"), mmap_mode=mode)
+            for name in ["points", "offsets", "route_type", "chart"]]
+        charts = pd.read_csv(os.path.join(out_path, "charts.csv"), dtype={"week": str})
+        return cls(*arrays, charts)
+
+    def route(self, i):
+        """
+        Points of route i, as a (n, 2) array of (x, y) yards.
+        """
+        return self.points[self.offsets[i]:self.offsets[i+1]]
+
+    def chart_routes(self, c):
+        """
+        Indexes of the routes of chart c.
+        """
+        return np.arange(*np.searchsorted(self.chart, [c, c + 1]))
+
+    def frame(self, routes=None):
+        """
+        Function to expand routes, by default all of them, to a Pandas DataFrame with one row
+        per polyline point, the chart information, route index and route type.
+        """
+        routes = np.arange(len(self)) if routes is None else np.asarray(routes)
+        lengths = self.offsets[routes + 1] - self.offsets[routes]
+        index = np.concatenate([np.arange(self.offsets[i], self.offsets[i+1]) for i in routes]
+            or [np.zeros(0, dtype=np.int64)])
+        df = self.charts.iloc[np.repeat(self.chart[routes], lengths)].reset_index(drop=True)
+        df["route"] = np.repeat(routes, lengths)
+        df["route_type"] = np.asarray(ROUTE_TYPES, dtype=object)[np.repeat(self.route_type[routes], lengths)]
+        df["x"] = self.points[index, 0]
+        df["y"] = self.points[index, 1]
+        return df
+
+
+def get_chart_info(data_file):
+    """
+    Extract player name, team, position, game ID, week and season from the data
+    corresponding to a route chart image.
+    """
+    with open(data_file) as _file:
+        data = json.load(_file)
+    return {"game_id": data["gameId"], "team": data["team"],
+        "week": data_file.split(os.sep)[-3],
+        "name": data["firstName"] + " " + data["lastName"],
+        "position": data["position"], "season": data_file.split(os.sep)[-4]}
+
+def extract_route_chart(image, data, tolerance=0.25):
+    """
+    Worker function for the main loop, returns the chart information with its routes.
+    """
+    info = get_chart_info(data)
+    if image is None:
+        return info, []
+    return info, chart_routes(image, tolerance)
+
+def route_chart_jobs(clean_path, seasons=None, tolerance=0.25):
+    """
+    Generate the (image, data, tolerance) of every route chart in clean_path, in os.walk order.
+    """
+    for (folder, dirs, files) in os.walk(clean_path):
+        if folder.split(os.sep)[-1] != "data":
+            continue
+        if (seasons is not None) and (folder.split(os.sep)[-3] not in seasons):
+            continue
+        for data_file in sorted(files):
+            if data_file.startswith("."):
+                continue
+            image = os.sep.join(folder.split(os.sep)[:-1] + ["images", data_file.split(".")[0] + ".jpeg"])
+            yield (image if os.path.exists(image) else None, os.path.join(folder, data_file), tolerance)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract route polylines from cleaned route charts')
+    parser.add_argument('-s', '--seasons', nargs='+', type=str, dest='seasons', default=None,
+        help='seasons to extract, by default all of them')
+    parser.add_argument('-j', '--workers', type=int, dest='workers', default=1,
+        help='number of worker processes')
+    parser.add_argument('--tolerance', type=float, dest='tolerance', default=0.25,
+        help='maximum distance in yards of a route from its polyline')
+    parser.add_argument('-o', '--out', type=str, dest='out_path', default="Routes",
+        help='folder of the extracted routes')
+    args = parser.parse_args()
+
+    print("Extracting routes...")
+    jobs = route_chart_jobs("Cleaned_Route_Charts", args.seasons, args.tolerance)
+    charts = list(imap_ordered(extract_route_chart, jobs, args.workers))
+    routes = RouteSet.from_charts(charts)
+    routes.save(args.out_path)
+    print(len(routes), "routes of", len(charts), "charts,", len(routes.points), "points")
+    print("Done.")
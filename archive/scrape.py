@@ -10,20 +10,15 @@ Example:
 	Image path = ./Pass_Charts/philadelphia-eagles/2017/super-bowl/images/Foles_Nick_QB.jpeg
 	Data path = ./Pass_Charts/philadelphia-eagles/2017/super-bowl/data/Foles_Nick_QB.txt
 """
-import requests 
 from bs4 import BeautifulSoup 
 import re
 import json
-import urllib
 import os
-import urllib.request
-import cv2
-import json
-import scipy.misc
-import pandas as pd
 import argparse
-
-parser = argparse.ArgumentParser(description='Download image from NFL next gen stats')
+from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fetch import Fetcher
+from manifest import Manifest, sha256, file_sha256
 
 teams = ["arizona-cardinals",
 	"atlanta-falcons",
@@ -64,52 +59,236 @@ seasons = ["2019"]
 weeks = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "11", "12", "13",
 "14", "15", "16", "17", "wild-card", "divisional", "conference", "super-bowl"]
 
-parser.add_argument('-s', '--seasons', nargs='+', type=str,dest='seasons',default=seasons, help='input season')
-parser.add_argument('-t', '--teams', nargs='+', type=str,dest='teams',default=teams, help='input team')
-parser.add_argument('-w', '--weeks', nargs='+', type=str,dest='weeks',default=weeks, help='input week')
-
-args = parser.parse_args()
-seasons = args.seasons
-weeks = args.weeks
-teams = args.teams
+base_url = "https://nextgenstats.nfl.com"
 
 pattern = re.compile("charts")
 
-print("Scraping images and html data...")
-for team in teams:
-	for season in seasons:
-		print(team, "\t", season)
-		for week in weeks:
-			URL = "https://nextgenstats.nfl.com/charts/list/pass/" + team + "/" + season + "/" + week
-			r = requests.get(URL)
 
-			soup = BeautifulSoup(r.content, "html.parser")
+def list_url(team, season, week, base_url=base_url):
+	"""
+	URL of the page listing the pass charts of a team in a week.
+	"""
+	return base_url + "/charts/list/pass/" + team + "/" + season + "/" + week
+
+def parse_charts(content):
+	"""
+	Function to get the pass charts embedded in a pass chart listing page.
+	
+	Input:
+		content: html of the page
+	Return:
+		charts: list of the data of every pass chart on the page
+	"""
+	soup = BeautifulSoup(content, "html.parser")
+
+	script = soup.find_all("script", text=pattern)
+
+	contains_charts = json.loads(str(script[0])[33:-131])
+
+	if (len(contains_charts["charts"]["charts"]) != 0):
+		return contains_charts["charts"]["charts"]['charts']
+	return []
+
+def get_charts(fetcher, team, season, week, base_url=base_url, manifest=None):
+	"""
+	Function to download and parse the pass chart listing page of a team in a week.
+	
+	Input:
+		fetcher: Fetcher
+		team, season, week: team, season and week of the page
+		base_url: root URL of Next Gen Stats
+		manifest: Manifest, if given the page is only downloaded if it changed since it was 
+			last completely scraped
+	Return:
+		charts: list of the data of every pass chart on the page, or None if it hasn't changed
+		r: response of the request
+	"""
+	URL = list_url(team, season, week, base_url)
+	headers = manifest.conditional_headers(URL) if manifest else {}
+	r = fetcher.get(URL, headers=headers)
+	if r.status_code == 304:
+		return None, r
+	return parse_charts(r.content), r
+
+def save_chart(fetcher, chart, team, season, week, base_url=base_url, out_path="Pass_Charts", 
+	manifest=None):
+	"""
+	Function to download the image of a pass chart and save it with its data.
+	
+	Input:
+		fetcher: Fetcher
+		chart: data of the pass chart, from parse_charts
+		team, season, week: team, season and week of the listing page of the chart
+		base_url: URL that the protocol relative image URL is resolved against
+		out_path: root folder of the images and data
+		manifest: Manifest, if given an image that is already saved is only downloaded again 
+			if the server says it changed, and unchanged files are not rewritten
+	Return:
+		img_file: path of the saved image
+		changed: True if the image or data of the chart is new or changed
+	"""
+	name = chart["lastName"] + "_" + chart["firstName"] + "_" + chart["position"]
+	chart["team"] = team
+
+	folder = str(out_path + os.sep + team + os.sep + season + os.sep + week + os.sep)
+	img_folder = folder + "images" + os.sep
+	data_folder = folder + "data" + os.sep
+
+	os.makedirs(img_folder, exist_ok=True)
+	os.makedirs(data_folder, exist_ok=True)
+
+	img_file = img_folder + name + ".jpeg"
+	data_file = data_folder + name + ".txt"
+	url = urljoin(base_url, chart["extraLargeImg"])
+
+	# only ask for the image if it changed, if the saved copy is the one in the manifest
+	entry = manifest.get(img_file) if manifest else None
+	headers = {}
+	if (entry is not None) and (entry["url"] == url) and (file_sha256(img_file) == entry["sha256"]):
+		headers = manifest.conditional_headers(img_file)
+	else:
+		entry = None
+
+	r = fetcher.get(url, headers=headers)
+
+	if r.status_code == 304:
+		img_sha = entry["sha256"]
+		img_changed = False
+	else:
+		img_sha = sha256(r.content)
+		img_changed = (entry is None) or (img_sha != entry["sha256"])
+
+	if img_changed:
+		# write to a temporary file first so an interrupted download never leaves a partial image
+		with open(img_file + ".part", "wb") as imgfile:
+			imgfile.write(r.content)
+		os.replace(img_file + ".part", img_file)
+
+	data = json.dumps(chart)
+	data_sha = sha256(data)
+	data_changed = (entry is None) or (entry.get("data_sha256") != data_sha) or \
+		(not os.path.exists(data_file))
+
+	if data_changed:
+		with open(data_file, 'w') as datafile: 
+			datafile.write(data)
+
+	if manifest:
+		entry = entry or {}
+		manifest.update(img_file, url=url, sha256=img_sha, data_sha256=data_sha, 
+			etag=r.headers.get("ETag", entry.get("etag")), 
+			last_modified=r.headers.get("Last-Modified", entry.get("last_modified")))
+
+	return img_file, (img_changed or data_changed)
+
+def scrape(teams, seasons, weeks, concurrency=8, rate=None, retries=5, 
+	base_url=base_url, out_path="Pass_Charts", incremental=True):
+	"""
+	Function to scrape every pass chart of teams in seasons and weeks, with up to concurrency 
+	listing pages and images downloading at once over a shared pool of connections.
+
+	Pages and images are recorded in the manifest '[out_path]/manifest.jsonl' as they finish. 
+	When incremental is True, reruns and interrupted crawls skip pages and charts that are 
+	already saved and haven't changed.
+	
+	Input:
+		teams, seasons, weeks: lists of teams, seasons and weeks to scrape
+		concurrency: number of downloads in progress at once
+		rate: maximum requests per second, or None for no limit
+		retries: number of times a failed request is retried, with exponential backoff
+		base_url: root URL of Next Gen Stats, or of a local stand-in server
+		out_path: root folder of the images and data
+		incremental: if False, download every page and image again
+	Return:
+		n_charts: number of new or changed charts saved
+	"""
+	fetcher = Fetcher(concurrency=concurrency, rate=rate, retries=retries)
+	manifest = Manifest(out_path + os.sep + "manifest.jsonl")
+	conditional = manifest if incremental else None
+	n_charts = 0
+	n_skipped = 0
+
+	# charts of each page left to download, a page is recorded once all of them are saved
+	remaining = {}
+
+	def page_done(URL, r):
+		manifest.update(URL, etag=r.headers.get("ETag"), 
+			last_modified=r.headers.get("Last-Modified"), sha256=sha256(r.content))
+
+	with ThreadPoolExecutor(max_workers=concurrency) as pool:
+		pages = {}
+		for team in teams:
+			for season in seasons:
+				for week in weeks:
+					future = pool.submit(get_charts, fetcher, team, season, week, base_url, 
+						conditional)
+					pages[future] = (team, season, week)
+
+		downloads = {}
+		for future in as_completed(pages):
+			(team, season, week) = pages[future]
+			URL = list_url(team, season, week, base_url)
+			try:
+				(charts, r) = future.result()
+			except Exception as e:
+				print(URL + '  is giving an error (' + str(e) + '). Skipping...')
+				continue
+			if charts is None:
+				continue
+			print(team, "\t", season, "\t", week, "\t", len(charts))
+
+			remaining[URL] = [len(charts), r]
+			if len(charts) == 0:
+				page_done(URL, r)
+
+			for chart in charts:
+				download = pool.submit(save_chart, fetcher, chart, team, season, week, 
+					base_url, out_path, conditional)
+				downloads[download] = URL
 
-			script = soup.find_all("script", text=pattern)
+		for download in as_completed(downloads):
+			URL = downloads[download]
+			try:
+				(img_file, changed) = download.result()
+			except Exception as e:
+				print(URL + '  image is giving an error (' + str(e) + '). Skipping...')
+				remaining[URL][0] = None
+				continue
 
-			contains_charts = json.loads(str(script[0])[33:-131])
+			if changed: n_charts += 1
+			else: n_skipped += 1
 
-			if (len(contains_charts["charts"]["charts"]) != 0):
-				for chart in contains_charts["charts"]["charts"]['charts']:
+			if remaining[URL][0] is not None:
+				remaining[URL][0] -= 1
+				if remaining[URL][0] == 0:
+					page_done(URL, remaining[URL][1])
 
-					name = chart["lastName"] + "_" + chart["firstName"] + "_" + chart["position"]
-					chart["team"] = team
+	fetcher.close()
+	manifest.close()
+	print(n_charts, "new or changed charts,", n_skipped, "unchanged")
+	return n_charts
 
-					folder = str("Pass_Charts" + os.sep + team + os.sep + season + os.sep + week + os.sep)
-					img_folder = folder + "images" + os.sep
-					data_folder = folder + "data" + os.sep
 
-					if not os.path.exists(img_folder):
-						os.makedirs(img_folder)
-					if not os.path.exists(data_folder):
-						os.makedirs(data_folder)
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Download image from NFL next gen stats')
 
-					img_file = img_folder + name + ".jpeg"
-					url = "https:" + chart["extraLargeImg"]
-					urllib.request.urlretrieve(url, img_file)
+	parser.add_argument('-s', '--seasons', nargs='+', type=str,dest='seasons',default=seasons, help='input season')
+	parser.add_argument('-t', '--teams', nargs='+', type=str,dest='teams',default=teams, help='input team')
+	parser.add_argument('-w', '--weeks', nargs='+', type=str,dest='weeks',default=weeks, help='input week')
+	parser.add_argument('-c', '--concurrency', type=int, dest='concurrency', default=8, 
+		help='number of downloads in progress at once')
+	parser.add_argument('-r', '--rate', type=float, dest='rate', default=None, 
+		help='maximum requests per second')
+	parser.add_argument('--retries', type=int, dest='retries', default=5, 
+		help='number of retries of a failed request')
+	parser.add_argument('--base-url', type=str, dest='base_url', default=base_url, 
+		help='root URL to scrape, e.g. a local test server')
+	parser.add_argument('--full', action='store_false', dest='incremental', 
+		help='download every page and image again, ignoring the manifest')
 
-					data_file = data_folder + name + ".txt"
-					with open(data_file, 'w') as datafile: 
-						json.dump(chart, datafile)
+	args = parser.parse_args()
 
-print("Done.")
+	print("Scraping images and html data...")
+	scrape(args.teams, args.seasons, args.weeks, args.concurrency, args.rate, 
+		args.retries, args.base_url, incremental=args.incremental)
+	print("Done.")
@@ -0,0 +1,250 @@
+"""
+Shard and merge execution of pipeline.py, for backfills split across several machines.
+
+The planner splits the listing pages of the teams, seasons and weeks into N shards with
+balanced numbers of pages. Every shard runs in its own folder '[root]/shard-[i]', with its own
+'Pass_Charts' tree and manifest, 'Cleaned_Pass_Charts' tree, extraction cache and
+'pass_locations.csv'. A shard that finishes without errors writes '_SUCCESS', and a shard
+that failed, or whose machine was lost, can be run again on its own.
+
+The merge step combines the outputs of all of the shards, which may have been copied from
+other machines into '[root]', into one file whose rows are in canonical order (by season,
+week, team and player, in the order of the lists of scrape.py, keeping the order of the rows
+of each chart). canonical() puts the output of a single-node run in the same order, so the
+two are identical.
+
+Usage:
+	python shards.py plan -n 4 -s 2017 2018 2019
+	python shards.py run 0 			# on each machine, with its shard number
+	python shards.py status
+	python shards.py run --failed 	# run the shards that failed again
+	python shards.py merge -o pass_locations.csv
+	python shards.py canonical single_node.csv -o single_node_canonical.csv
+"""
+
+import os
+import json
+import argparse
+import pandas as pd
+import scrape
+from pipeline import pipeline
+from cache import ResultCache
+
+PLAN_FILE = "plan.json"
+SUCCESS_FILE = "_SUCCESS"
+FAILED_FILE = "_FAILED"
+
+
+def plan(teams, seasons, weeks, n_shards, root="Shards"):
+	"""
+	Function to split the listing pages of teams in seasons and weeks into n_shards shards,
+	and write the plan to '[root]/plan.json'.
+
+	Pages are dealt out in order of season, week and team, so every shard gets a share of
+	every week and the shards differ by at most one page.
+
+	Input:
+		teams, seasons, weeks: lists of teams, seasons and weeks to scrape
+		n_shards: number of shards
+		root: folder of the plan and the shards
+	Return:
+		shards: list of the list of (team, season, week) pages of every shard
+	"""
+	pages = [(team, season, week) for season in seasons for week in weeks for team in teams]
+	shards = [pages[i::n_shards] for i in range(n_shards)]
+
+	os.makedirs(root, exist_ok=True)
+	with open(os.path.join(root, PLAN_FILE), "w") as _file:
+		json.dump({"teams": teams, "seasons": seasons, "weeks": weeks, "shards": shards}, _file)
+	return shards
+
+def load_plan(root="Shards"):
+	with open(os.path.join(root, PLAN_FILE)) as _file:
+		return json.load(_file)
+
+def shard_path(root, i):
+	return os.path.join(root, "shard-%03d" % i)
+
+def status(root="Shards"):
+	"""
+	Function to get the status of every shard of the plan in root.
+
+	Return:
+		statuses: list of "done", "failed" or "pending" for every shard
+	"""
+	statuses = []
+	for i in range(len(load_plan(root)["shards"])):
+		folder = shard_path(root, i)
+		if os.path.exists(os.path.join(folder, SUCCESS_FILE)):
+			statuses.append("done")
+		elif os.path.exists(os.path.join(folder, FAILED_FILE)):
+			statuses.append("failed")
+		else:
+			statuses.append("pending")
+	return statuses
+
+def run_shard(i, root="Shards", **kw):
+	"""
+	Function to run shard i of the plan in root with pipeline(), in the folder of the shard.
+
+	A shard that is run again downloads only the images that changed, with its manifest, and
+	extracts only charts that aren't in its cache, but lists every page and writes its whole
+	output again. The shard is only done if every chart of every one of its pages is written.
+
+	Input:
+		i: number of the shard
+		root: folder of the plan and the shards
+		kw: other arguments of pipeline(), e.g. the worker counts, rate or base_url
+	Return:
+		ok: True if every page and chart of the shard was processed without an error
+	"""
+	shards = load_plan(root)["shards"]
+	folder = shard_path(root, i)
+	os.makedirs(folder, exist_ok=True)
+	for marker in [SUCCESS_FILE, FAILED_FILE]:
+		if os.path.exists(os.path.join(folder, marker)):
+			os.remove(os.path.join(folder, marker))
+
+	# the stages use paths relative to the working directory, which worker processes inherit
+	cwd = os.getcwd()
+	errors = []
+	pages_done = []
+	os.chdir(folder)
+	try:
+		cache = ResultCache("Extraction_Cache")
+		n_charts = pipeline([], [], [], pages=shards[i], errors=errors, pages_done=pages_done,
+			cache=cache, **kw)
+	except Exception as e:
+		errors.append(("pipeline", "shard-%03d" % i, str(e)))
+		n_charts = 0
+	finally:
+		os.chdir(cwd)
+
+	base_url = kw.get("base_url", scrape.base_url)
+	pages_done = set(pages_done)
+	missing = [page for page in shards[i]
+		if scrape.list_url(*page, base_url=base_url) not in pages_done]
+	if missing:
+		errors.append(("pipeline", "shard-%03d" % i, "%d of %d pages weren't completely written, "
+			"e.g. %s" % (len(missing), len(shards[i]), "/".join(missing[0]))))
+
+	marker = FAILED_FILE if errors else SUCCESS_FILE
+	with open(os.path.join(folder, marker), "w") as _file:
+		json.dump({"pages": len(shards[i]), "charts": n_charts, "errors": errors}, _file)
+	return not errors
+
+def canonical(df, weeks=scrape.weeks, teams=scrape.teams):
+	"""
+	Function to sort pass locations by season, week, team and player, keeping the order of
+	the rows of each chart. Weeks and teams are in the order of the lists weeks and teams.
+	"""
+	key = pd.DataFrame({
+		"season": df["season"].astype(str),
+		"week": df["week"].astype(str).map({w: i for (i, w) in enumerate(weeks)}).fillna(len(weeks)),
+		"team": df["team"].astype(str).map({t: i for (i, t) in enumerate(teams)}).fillna(len(teams)),
+		"team_name": df["team"].astype(str),
+		"name": df["name"].astype(str),
+		"game_id": df["game_id"].astype(str),
+	})
+	order = key.sort_values(list(key.columns), kind="mergesort").index
+	return df.loc[order].reset_index(drop=True)
+
+def read_pass_locations(csv_file):
+	"""
+	Read a pass locations .csv file with every column as it was written.
+	"""
+	return pd.read_csv(csv_file, dtype=str, keep_default_na=False)
+
+def merge(root="Shards", out_file="pass_locations.csv", force=False):
+	"""
+	Function to merge the outputs of all of the shards of the plan in root.
+
+	Input:
+		root: folder of the plan and the shards
+		out_file: .csv file of the merged pass locations
+		force: if True, merge even if some shards aren't done
+	Return:
+		n_rows: number of rows in out_file
+	"""
+	statuses = status(root)
+	not_done = [i for (i, s) in enumerate(statuses) if s != "done"]
+	if not_done and not force:
+		raise RuntimeError("shards %s are not done, run them again or merge with force" %
+			", ".join(str(i) for i in not_done))
+
+	frames = [read_pass_locations(os.path.join(shard_path(root, i), "pass_locations.csv"))
+		for (i, s) in enumerate(statuses) if s == "done"]
+	df = canonical(pd.concat(frames, ignore_index=True))
+	df.to_csv(out_file, index=False)
+	return len(df)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Split a backfill into shards, run them, and merge their outputs')
+	parser.add_argument('--root', type=str, dest='root', default="Shards",
+		help='folder of the plan and the shards')
+	commands = parser.add_subparsers(dest='command')
+
+	plan_parser = commands.add_parser('plan', help='split the listing pages into shards')
+	plan_parser.add_argument('-n', '--shards', type=int, dest='shards', required=True, help='number of shards')
+	plan_parser.add_argument('-s', '--seasons', nargs='+', type=str, dest='seasons', default=scrape.seasons, help='input season')
+	plan_parser.add_argument('-t', '--teams', nargs='+', type=str, dest='teams', default=scrape.teams, help='input team')
+	plan_parser.add_argument('-w', '--weeks', nargs='+', type=str, dest='weeks', default=scrape.weeks, help='input week')
+
+	run_parser = commands.add_parser('run', help='run shards')
+	run_parser.add_argument('shards', nargs='*', type=int, help='numbers of the shards to run')
+	run_parser.add_argument('--failed', action='store_true', dest='failed',
+		help='run every shard that failed or hasn\'t run yet')
+	run_parser.add_argument('--download-workers', type=int, dest='download_workers', default=8,
+		help='number of images downloading at once')
+	run_parser.add_argument('--clean-workers', type=int, dest='clean_workers', default=1,
+		help='number of worker processes cleaning images')
+	run_parser.add_argument('--extract-workers', type=int, dest='extract_workers', default=1,
+		help='number of worker processes extracting pass locations')
+	run_parser.add_argument('-r', '--rate', type=float, dest='rate', default=None,
+		help='maximum requests per second')
+	run_parser.add_argument('--base-url', type=str, dest='base_url', default=scrape.base_url,
+		help='root URL to scrape, e.g. a local test server')
+
+	commands.add_parser('status', help='print the status of every shard')
+
+	merge_parser = commands.add_parser('merge', help='merge the outputs of the shards')
+	merge_parser.add_argument('-o', '--out', type=str, dest='out_file', default="pass_locations.csv",
+		help='.csv file of the merged pass locations')
+	merge_parser.add_argument('--force', action='store_true', dest='force',
+		help='merge the shards that are done, even if others aren\'t')
+
+	canonical_parser = commands.add_parser('canonical', help='put the output of a single-node run in canonical order')
+	canonical_parser.add_argument('csv_file', type=str, help='.csv file of pass locations')
+	canonical_parser.add_argument('-o', '--out', type=str, dest='out_file', default=None,
+		help='.csv file of the sorted pass locations, by default csv_file itself')
+
+	args = parser.parse_args()
+
+	if args.command == 'plan':
+		shards = plan(args.teams, args.seasons, args.weeks, args.shards, args.root)
+		print("Planned", len(shards), "shards of", min(map(len, shards)), "to", max(map(len, shards)), "pages")
+
+	elif args.command == 'run':
+		to_run = args.shards
+		if args.failed:
+			to_run = [i for (i, s) in enumerate(status(args.root)) if s != "done"]
+		for i in to_run:
+			ok = run_shard(i, args.root, download_workers=args.download_workers,
+				clean_workers=args.clean_workers, extract_workers=args.extract_workers,
+				rate=args.rate, base_url=args.base_url)
+			print("shard", i, "done" if ok else "failed, run it again")
+
+	elif args.command == 'status':
+		for (i, s) in enumerate(status(args.root)):
+			print("shard-%03d" % i, s)
+
+	elif args.command == 'merge':
+		n_rows = merge(args.root, args.out_file, args.force)
+		print("Merged", n_rows, "rows into", args.out_file)
+
+	elif args.command == 'canonical':
+		canonical(read_pass_locations(args.csv_file)).to_csv(args.out_file or args.csv_file, index=False)
+
+	else:
+		parser.print_help()
@@ -0,0 +1,231 @@
+"""
+Compact, memory mapped store of pass locations, such as 'all_pass_locations.csv', for fast
+repeated queries by player, team, season, week, pass type and field region.
+
+build_store() parses the .csv file once and writes one .npy file per column to a folder:
+integer codes for name, team, pass_type and week, int16 season and float32 x and y. The rows
+are sorted by player, so the rows of a player are a contiguous range, and the store also
+has a row index per team and a grid index of 5 x 5 yard cells. PassStore memory maps the
+columns and indexes, so a query only reads the rows it touches.
+
+Example:
+	store = load_store("all_pass_locations.csv")
+	# all deep left passes by Patrick Mahomes in 2020
+	store.frame(store.query(name="Patrick Mahomes", season=2020, x=(None, -10), y=(20, None)))
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+CODED_COLUMNS = ["name", "team", "pass_type", "week"]
+
+# grid of the spatial index, in yards
+GRID_X = (-30.0, 30.0)
+GRID_Y = (-15.0, 85.0)
+GRID_CELL = 5.0
+
+
+def _grid_shape():
+	return (int((GRID_X[1] - GRID_X[0])/GRID_CELL), int((GRID_Y[1] - GRID_Y[0])/GRID_CELL))
+
+def _cells(x, y):
+	"""
+	Grid cell of every location, or -1 for locations that are NaN.
+	"""
+	nx, ny = _grid_shape()
+	with np.errstate(invalid="ignore"):
+		ix = np.clip(np.floor((x - GRID_X[0])/GRID_CELL), 0, nx - 1)
+		iy = np.clip(np.floor((y - GRID_Y[0])/GRID_CELL), 0, ny - 1)
+	cells = ix*ny + iy
+	return np.where(np.isnan(cells), -1, cells).astype(np.int32)
+
+def _csr(keys, n_keys):
+	"""
+	Function to index rows by an integer key.
+
+	Return:
+		rows: row numbers sorted by key
+		offsets: rows[offsets[k]:offsets[k+1]] are the rows with key k
+	"""
+	rows = np.argsort(keys, kind="stable").astype(np.int32)
+	offsets = np.searchsorted(keys[rows], np.arange(n_keys + 1)).astype(np.int64)
+	return rows, offsets
+
+def build_store(csv_file, root):
+	"""
+	Function to convert a .csv file of pass locations to a memory mapped store.
+
+	Input:
+		csv_file: .csv file with name, team, pass_type, week, season, x and y columns
+		root: folder of the store, created if it doesn't exist
+	"""
+	df = pd.read_csv(csv_file, dtype={c: str for c in CODED_COLUMNS})
+	os.makedirs(root, exist_ok=True)
+
+	codes = {}
+	dictionaries = {}
+	for c in CODED_COLUMNS:
+		cat = pd.Categorical(df[c].fillna(""))
+		dictionaries[c] = [str(v) for v in cat.categories]
+		codes[c] = cat.codes.astype(np.int32)
+
+	# sort the rows by player, then season and week
+	season = pd.to_numeric(df["season"], errors="coerce").fillna(0).astype(np.int16).values
+	order = np.lexsort((codes["week"], season, codes["name"]))
+
+	columns = {
+		"name": codes["name"][order].astype(np.int32),
+		"team": codes["team"][order].astype(np.int16),
+		"pass_type": codes["pass_type"][order].astype(np.int8),
+		"week": codes["week"][order].astype(np.int8),
+		"season": season[order],
+		"x": df["x"].values[order].astype(np.float32),
+		"y": df["y"].values[order].astype(np.float32),
+	}
+	if "game_id" in df:
+		columns["game_id"] = pd.to_numeric(df["game_id"], errors="coerce").fillna(0).astype(np.int64).values[order]
+
+	for (c, values) in columns.items():
+		np.save(os.path.join(root, c + ".npy"), values)
+
+	_, player_offsets = _csr(columns["name"], len(dictionaries["name"]))
+	team_rows, team_offsets = _csr(columns["team"], len(dictionaries["team"]))
+	nx, ny = _grid_shape()
+	cells = _cells(columns["x"], columns["y"])
+	located = np.flatnonzero(cells >= 0)
+	grid_rows, grid_offsets = _csr(cells[located], nx*ny)
+
+	np.save(os.path.join(root, "player_offsets.npy"), player_offsets)
+	np.save(os.path.join(root, "team_rows.npy"), team_rows)
+	np.save(os.path.join(root, "team_offsets.npy"), team_offsets)
+	np.save(os.path.join(root, "grid_rows.npy"), located[grid_rows].astype(np.int32))
+	np.save(os.path.join(root, "grid_offsets.npy"), grid_offsets)
+
+	stat = os.stat(csv_file)
+	meta = {"source": os.path.abspath(csv_file), "size": stat.st_size, "mtime": stat.st_mtime,
+		"n_rows": len(df), "columns": sorted(columns), "dictionaries": dictionaries}
+	with open(os.path.join(root, "meta.json"), "w") as _file:
+		json.dump(meta, _file)
+
+
+class PassStore(object):
+	"""
+	Memory mapped pass locations written by build_store.
+
+	Input:
+		root: folder of the store
+	"""
+
+	def __init__(self, root):
+		self.root = root
+		with open(os.path.join(root, "meta.json")) as _file:
+			self.meta = json.load(_file)
+		self.n_rows = self.meta["n_rows"]
+		self.columns = {c: self._load(c) for c in self.meta["columns"]}
+		self.dictionaries = self.meta["dictionaries"]
+		self._codes = {c: {v: i for (i, v) in enumerate(values)}
+			for (c, values) in self.dictionaries.items()}
+
+		self.player_offsets = self._load("player_offsets")
+		self.team_rows = self._load("team_rows")
+		self.team_offsets = self._load("team_offsets")
+		self.grid_rows = self._load("grid_rows")
+		self.grid_offsets = self._load("grid_offsets")
+
+	def _load(self, name):
+		return np.load(os.path.join(self.root, name + ".npy"), mmap_mode="r")
+
+	def code(self, column, value):
+		"""
+		Integer code of value in a coded column, or -1 if it isn't in the store.
+		"""
+		return self._codes[column].get(str(value), -1)
+
+	def _region_rows(self, x, y):
+		nx, ny = _grid_shape()
+		lo_x = GRID_X[0] if x[0] is None else x[0]
+		hi_x = GRID_X[1] if x[1] is None else x[1]
+		lo_y = GRID_Y[0] if y[0] is None else y[0]
+		hi_y = GRID_Y[1] if y[1] is None else y[1]
+		ix = np.arange(*np.clip(np.floor((np.array([lo_x, hi_x]) - GRID_X[0])/GRID_CELL) + [0, 1], 0, nx).astype(int))
+		iy = np.arange(*np.clip(np.floor((np.array([lo_y, hi_y]) - GRID_Y[0])/GRID_CELL) + [0, 1], 0, ny).astype(int))
+		cells = (ix[:, None]*ny + iy[None, :]).ravel()
+		if len(cells) == 0:
+			return np.zeros(0, dtype=np.int32)
+		return np.concatenate([self.grid_rows[self.grid_offsets[c]:self.grid_offsets[c+1]]
+			for c in cells])
+
+	def query(self, name=None, team=None, season=None, week=None, pass_type=None,
+		x=(None, None), y=(None, None)):
+		"""
+		Function to find the rows matching every given condition.
+
+		Input:
+			name, team, season, week, pass_type: value of the column, or None for any
+			x, y: (low, high) range in yards, either end None for unbounded
+		Return:
+			rows: numpy.ndarray of the matching row numbers, in increasing order
+		"""
+		region = (x != (None, None)) or (y != (None, None))
+
+		# start from the smallest index that applies
+		if name is not None:
+			c = self.code("name", name)
+			if c < 0: return np.zeros(0, dtype=np.int64)
+			rows = np.arange(self.player_offsets[c], self.player_offsets[c+1])
+		elif team is not None:
+			c = self.code("team", team)
+			if c < 0: return np.zeros(0, dtype=np.int64)
+			rows = np.sort(self.team_rows[self.team_offsets[c]:self.team_offsets[c+1]])
+		elif region:
+			rows = np.sort(self._region_rows(x, y))
+		else:
+			rows = np.arange(self.n_rows)
+
+		keep = np.ones(len(rows), dtype=bool)
+		for (column, value) in [("team", team), ("week", week), ("pass_type", pass_type)]:
+			if value is not None:
+				keep &= (self.columns[column][rows] == self.code(column, value))
+		if season is not None:
+			keep &= (self.columns["season"][rows] == int(season))
+		for (column, (lo, hi)) in [("x", x), ("y", y)]:
+			values = self.columns[column][rows]
+			if lo is not None: keep &= (values >= lo)
+			if hi is not None: keep &= (values <= hi)
+		return rows[keep]
+
+	def frame(self, rows):
+		"""
+		Function to decode rows of the store into a Pandas DataFrame.
+		"""
+		df = {}
+		for (c, values) in self.columns.items():
+			values = np.asarray(values[rows])
+			if c in self.dictionaries:
+				values = np.asarray(self.dictionaries[c], dtype=object)[values]
+			df[c] = values
+		return pd.DataFrame(df)
+
+
+def load_store(csv_file, root=None):
+	"""
+	Function to open the store of csv_file, building it first if it doesn't exist or the
+	.csv file changed since it was built.
+
+	Input:
+		csv_file: .csv file of pass locations
+		root: folder of the store, by default '[csv_file without .csv]_store'
+	"""
+	root = root or os.path.splitext(csv_file)[0] + "_store"
+	meta_file = os.path.join(root, "meta.json")
+	stat = os.stat(csv_file)
+	stale = True
+	if os.path.exists(meta_file):
+		with open(meta_file) as _file:
+			meta = json.load(_file)
+		stale = (meta["size"] != stat.st_size) or (meta["mtime"] != stat.st_mtime)
+	if stale:
+		build_store(csv_file, root)
+	return PassStore(root)
@@ -0,0 +1,225 @@
+"""
+Generator of synthetic pass charts with known pass locations, for measuring the speed and
+accuracy of the pipeline without scraping Next Gen Stats.
+
+A chart is drawn on the undistorted field, in either the 50 or 70 yard layout, with the
+line of scrimmage, yard lines, sideline labels, pass markers of every type and touchdown
+trajectories, then warped into the trapezoidal field of a 1200 x 1200 Next Gen Stats image.
+Everything is drawn from a seed, so the same seed always gives the same chart.
+"""
+
+import os
+import cv2
+import json
+import math
+import numpy as np
+import pandas as pd
+from undistort_field import LABEL_BOXES
+
+
+FIELD_COLOR = (108, 96, 86)
+BACKGROUND_COLOR = (30, 30, 30)
+YARD_LINE_COLOR = (140, 128, 118)
+LABEL_COLOR = (255, 255, 255)
+
+# BGR color of each pass type, inside the color ranges of chart.COLOR_RANGES
+MARKER_COLORS = {
+    "COMPLETE": (60, 200, 60),
+    "INCOMPLETE": (255, 255, 255),
+    "INTERCEPTION": (0, 0, 220),
+    "TOUCHDOWN": (200, 80, 20),
+}
+MARKER_RADIUS = 7
+
+# geometry of each layout: top left corner of the field and first row of the field on the
+# left edge of the cropped image, the rows of the line of scrimmage and of the farthest
+# yard line, and the yards between them
+LAYOUTS = {
+    70: {"top_left": 130, "start": 390, "LOS": 596, "far_line": 0, "yards": 75},
+    50: {"top_left": 130, "start": 419, "LOS": 572, "far_line": 5, "yards": 55},
+}
+
+# pixels between the bottom left corner of a sideline label's text and that of its box
+LABEL_INSET = 3
+
+
+def layout_size(layout):
+    """
+    Function to get the grey border size and width of the undistorted image of a layout,
+    computed the same way as undistort_field.get_layout.
+    """
+    g = LAYOUTS[layout]
+    bs = int(math.ceil(float(g["top_left"]*680)/float(g["start"])) - g["top_left"])
+    return bs, 1200 + 2*bs
+
+def label_anchors(layout):
+    """
+    Function to get the bottom left corner of the text of every sideline label of a layout
+    in the undistorted image, inside its box of undistort_field.LABEL_BOXES, so that the
+    labels are where clean_field removes them.
+
+    Return:
+        los: (x, y) of the two "LOS" labels
+        labels: list of (yards, (x, y) of the left and right labels), from the line of
+            scrimmage out
+    """
+    anchors = [(min(x0, x0 if x1 is None else x1) + LABEL_INSET, max(y0, y1) - LABEL_INSET)
+        for ((x0, y0), (x1, y1)) in LABEL_BOXES[layout]]
+    return anchors[:2], [(10*(i + 1), anchors[2 + 2*i:4 + 2*i])
+        for i in range((len(anchors) - 2)//2)]
+
+def yards_to_pixels(xy, layout):
+    """
+    Function to map field locations in yards to (row, column) pixels of the undistorted
+    image, the inverse of pass_detection.map_pass_locations.
+    """
+    g = LAYOUTS[layout]
+    bs, col = layout_size(layout)
+    _1_yd_x = float(col - 40*2)/53.33
+    _1_yd_y = float(g["LOS"] - g["far_line"])/g["yards"]
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    return np.column_stack([g["LOS"] - xy[:, 1]*_1_yd_y, col/2 + xy[:, 0]*_1_yd_x])
+
+def sample_passes(rng, counts, layout, min_dist=3*MARKER_RADIUS):
+    """
+    Function to draw random pass locations that don't overlap.
+
+    Input:
+        rng: numpy.random.RandomState
+        counts: {pass_type: number of passes}
+        layout: 50 or 70
+        min_dist: minimum distance in pixels between two markers
+    Return:
+        truth: Pandas DataFrame of the pass_type, x and y in yards of every pass
+    """
+    g = LAYOUTS[layout]
+    rows = []
+    placed = np.zeros((0, 2))
+    for pass_type in ["COMPLETE", "TOUCHDOWN", "INTERCEPTION", "INCOMPLETE"]:
+        for _ in range(counts.get(pass_type, 0)):
+            for attempt in range(1000):
+                xy = (rng.uniform(-24, 24), rng.uniform(-8, g["yards"] - 8))
+                p = yards_to_pixels(xy, layout)
+                if len(placed) == 0 or np.hypot(*(placed - p).T).min() >= min_dist:
+                    break
+            placed = np.vstack([placed, p])
+            rows.append([pass_type, xy[0], xy[1]])
+    return pd.DataFrame(rows, columns = ["pass_type", "x", "y"])
+
+def draw_field(truth, layout, rng):
+    """
+    Function to draw an undistorted pass chart field with the passes of truth.
+
+    Return:
+        field: numpy.ndarray, BGR image of the undistorted field
+    """
+    g = LAYOUTS[layout]
+    bs, col = layout_size(layout)
+    field = np.zeros((680, col, 3), dtype=np.uint8)
+    field[:] = FIELD_COLOR
+
+    # yard lines every 10 yards, and the line of scrimmage in touchdown blue
+    for yards in range(-10, g["yards"] + 1, 10):
+        row = int(round(yards_to_pixels((0, yards), layout)[0, 0]))
+        cv2.line(field, (40, row), (col - 40, row), YARD_LINE_COLOR, 1)
+    cv2.line(field, (40, g["LOS"]), (col - 40, g["LOS"]), MARKER_COLORS["TOUCHDOWN"], 3)
+
+    # sideline labels, which clean_field should remove
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    los, labels = label_anchors(layout)
+    for (yards, anchors) in labels:
+        for anchor in anchors:
+            cv2.putText(field, str(yards), anchor, font, 0.4, LABEL_COLOR, 1)
+    for anchor in los:
+        cv2.putText(field, "LOS", anchor, font, 0.45, LABEL_COLOR, 1)
+
+    centers = yards_to_pixels(truth[["x", "y"]].to_numpy(), layout)
+    for (pass_type, (row, column)) in zip(truth["pass_type"], centers):
+        color = MARKER_COLORS[pass_type]
+        center = (int(round(column)), int(round(row)))
+        if pass_type == "TOUCHDOWN":
+            start = (int(col/2 + rng.uniform(-60, 60)), g["LOS"])
+            cv2.line(field, start, center, color, 2, cv2.LINE_AA)
+        cv2.circle(field, center, MARKER_RADIUS, color, -1, cv2.LINE_AA)
+
+    return field
+
+def distort_field(field, layout):
+    """
+    Function to warp an undistorted field into the trapezoid of a 1200 x 1200 pass chart,
+    the inverse of undistort_field.undistort_field.
+    """
+    g = LAYOUTS[layout]
+    bs, b_col = layout_size(layout)
+    tl = g["top_left"]
+
+    pts_src = np.array([[0, 680], [tl+bs, 0], [1200-tl+bs, 0], [b_col, 680]])
+    pts_dst = np.array([[0, 680], [0, 0], [b_col, 0], [b_col, 680]])
+    h, status = cv2.findHomography(pts_src, pts_dst)
+
+    trapezoid = cv2.warpPerspective(field, h, (b_col, 680), flags=cv2.INTER_LINEAR |
+        cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_CONSTANT, borderValue=BACKGROUND_COLOR)
+
+    image = np.zeros((1200, 1200, 3), dtype=np.uint8)
+    image[:] = BACKGROUND_COLOR
+    image[0:680] = trapezoid[:, bs:bs+1200]
+    return image
+
+def make_chart(seed, layout=None, counts=None):
+    """
+    Function to generate a synthetic pass chart.
+
+    Input:
+        seed: random seed of the chart
+        layout: 50 or 70, or None to choose at random
+        counts: {pass_type: number of passes}, or None to choose at random
+    Return:
+        image: numpy.ndarray, BGR 1200 x 1200 image of the pass chart
+        data: chart data, in the format of the data scraped with the image
+        truth: Pandas DataFrame of the pass_type, x and y in yards of every pass
+    """
+    rng = np.random.RandomState(seed)
+    if layout is None:
+        layout = [50, 70][rng.randint(2)]
+    if counts is None:
+        counts = {"COMPLETE": rng.randint(8, 26), "INCOMPLETE": rng.randint(3, 13),
+            "INTERCEPTION": rng.randint(0, 3), "TOUCHDOWN": rng.randint(0, 4)}
+
+    truth = sample_passes(rng, counts, layout)
+    image = distort_field(draw_field(truth, layout, rng), layout)
+
+    n = {t: counts.get(t, 0) for t in MARKER_COLORS}
+    data = {"completions": n["COMPLETE"] + n["TOUCHDOWN"], "passingYards": 0,
+        "touchdowns": n["TOUCHDOWN"], "playerNameSlug": "synthetic-%d" % seed, "teamId": "0",
+        "interceptions": n["INTERCEPTION"], "playerName": "Synthetic %d" % seed,
+        "season": 2000, "position": "QB", "type": "reg", "week": 1, "gameId": seed,
+        "esbId": "SYN%06d" % seed, "firstName": "Synthetic", "lastName": str(seed),
+        "attempts": sum(n.values()), "team": "synthetic", "layout": layout}
+    return image, data, truth
+
+def write_charts(out_path, n_charts, seed=0, layout=None):
+    """
+    Function to write synthetic pass charts in the folder format of scrape.py, and their
+    pass locations to '[out_path]/truth.csv'.
+
+    Input:
+        out_path: root folder, e.g. 'Pass_Charts'
+        n_charts: number of charts
+        seed: seed of the first chart, chart i uses seed + i
+        layout: 50 or 70, or None to choose at random for each chart
+    """
+    folder = os.path.join(out_path, "synthetic", "2000", "1")
+    os.makedirs(os.path.join(folder, "images"), exist_ok=True)
+    os.makedirs(os.path.join(folder, "data"), exist_ok=True)
+
+    truths = []
+    for i in range(n_charts):
+        image, data, truth = make_chart(seed + i, layout)
+        name = data["lastName"] + "_" + data["firstName"] + "_" + data["position"]
+        cv2.imwrite(os.path.join(folder, "images", name + ".jpeg"), image)
+        with open(os.path.join(folder, "data", name + ".txt"), "w") as _file:
+            json.dump(data, _file)
+        truth.insert(0, "name", data["firstName"] + " " + data["lastName"])
+        truths.append(truth)
+
+    pd.concat(truths, ignore_index=True).to_csv(os.path.join(out_path, "truth.csv"), index=False)
@@ -4,22 +4,29 @@ Author: Sarah Mallepalle (updated to work in Python 3 by Ethan Douglas)
 For a single pass chart image in 'Pass_Charts', extract only the trapezoidal image of the field, 
 undistort the field by turning the trapezoid into a rectangle, remove the sideline labels, 
 and save the new image to the folder 'Cleaned_Pass_Charts'.
+
+Every stage takes and returns a numpy.ndarray in BGR order, so a chart is only read from and 
+written to disk once. File paths are still accepted as input and are read with cv2.imread.
 """
 
 import cv2
-import os
-from skimage import data, color, img_as_ubyte, io
-from skimage import feature
-from skimage.feature import canny
-from skimage.transform import hough_ellipse
-from skimage.draw import ellipse_perimeter
 import math
-from PIL import Image
-from PIL import ImageDraw
 import numpy as np
+from collections import OrderedDict
+import instrument
 
+# color of the field, used to fill the border and paint over the sideline labels
+GREY_COLOR = (108,96,86)
 
 
+def read_image(image):
+	"""
+	Return image as a numpy.ndarray, reading it from disk if it is a file path.
+	"""
+	if isinstance(image, str):
+		return cv2.imread(image)
+	return image
+
 def get_top(image):
 	"""
 	Function to get the pixel location of the top of the trapezoidal field.
@@ -29,90 +36,200 @@ def get_top(image):
 	Return:
 		top_left: location of the top left of the trapezoidal field
 	"""
-	frame = cv2.imread(image, 0)
+	frame = cv2.cvtColor(read_image(image), cv2.COLOR_BGR2GRAY)
 	ret, img = cv2.threshold(frame, 40, 255, cv2.THRESH_BINARY_INV)
 
-	points = np.fliplr(np.argwhere(img==0))
-
 	mid = 600
-	top = None
-	top_left = None
-	top_right = None
 
-	for p in points:
-		if (p[0] == mid):
-			if (top == None): 
-				top = p[1]
-				break
+	# top of the field is the first field pixel down the middle column,
+	# and top left is the first field pixel along that row
+	top = np.flatnonzero(img[:, mid] == 0)
+	if len(top) == 0:
+		return None
 
-	for p in points:
-		if (p[1] == top):
-			if (top_left == None):
-				top_left = p[0]
-				break
+	top_left = np.flatnonzero(img[top[0]] == 0)[0]
 
-	return top_left
+	return int(top_left)
 
-def make_grey_border(image):
+def get_start(image):
 	"""
-	Function to add a grey border to the left and right of the trapezoidal field, 
-	in order to undistort the trapezoid.
+	Function to get the first row of the field along the left edge of the image.
 	
 	Input:
 		image: image from the folder 'Pass_Charts'
 	Return:
-		top_left: location of the top left of the trapezoidal field
-		bordersize: width of the border in pixels added to the image
-		border: numpy.ndarray representation of input image with border
-		
+		start: first row of the left edge whose red channel is above 70, or 0
+	"""
+	im = read_image(image)
+	rows = np.flatnonzero(im[:, 0, 2] > 70)
+	if len(rows) == 0:
+		return 0
+	return int(rows[0])
+
+# undistortion maps of the most recently used chart layouts, keyed by layout_signature. A
+# signature is measured on JPEG pixels, so a chart can be a pixel off its layout and add a
+# new one; each holds several MB of maps, so only the last MAX_LAYOUTS are kept
+MAX_LAYOUTS = 8
+_layouts = OrderedDict()
+
+def layout_signature(image):
+	"""
+	Function to get the geometry of a pass chart, which is the same for every chart
+	drawn with the same layout (50 or 70 yards in front of the line of scrimmage).
+	
+	Input:
+		image: image from the folder 'Pass_Charts'
+	Return:
+		signature: (rows, columns, top left of the field, first row of the field)
 	"""
-	top_left = get_top(image)
-	im = cv2.imread(image)
+	im = read_image(image)
 	row, col = im.shape[:2]
+	return (row, col, get_top(im), get_start(im))
+
+def get_layout(signature):
+	"""
+	Function to get the grey border size and the cv2.remap maps that undistort
+	every chart with the given layout signature. The maps are computed the first 
+	time a layout is seen and cached.
 	
-	grey_color = [108,96,86]
+	Input:
+		signature: layout_signature of the image
+	Return:
+		layout: (bordersize, map1, map2), or None if the field can't be undistorted
+	"""
+	if signature in _layouts:
+		_layouts.move_to_end(signature)
+		return _layouts[signature]
 
-	start = 0
-	for i in range(row):
-		if (im[i,0,2] > 70): 
-			start = i 
-			break
+	i_row, i_col, tl, start = signature
+	bs = int(math.ceil(float(tl*i_row)/float(start)) - tl)
+	b_row, b_col = i_row, i_col + 2*bs
 
-	bordersize = int(math.ceil(float(top_left*row)/float(start)) - top_left)
+	if b_col > 1398:
+		return _cache_layout(signature, None)
 
-	border = cv2.copyMakeBorder(im, top=0, bottom=0, 
-		left=bordersize, right=bordersize, 
-		borderType= cv2.BORDER_CONSTANT, value=grey_color)
+	pts_src = np.array([[0, i_row], [tl+bs, 0], [i_col-tl+bs, 0],[b_col, i_row]])
+	pts_dst = np.array([[0, b_row],[0, 0],[b_col, 0],[b_col, b_row]])
+
+	h, status = cv2.findHomography(pts_src, pts_dst)
+
+	# source pixel of every pixel of the undistorted image, as in cv2.warpPerspective
+	xs, ys = np.meshgrid(np.arange(b_col, dtype=np.float32), np.arange(b_row, dtype=np.float32))
+	pts = np.dstack([xs, ys]).reshape(-1, 1, 2)
+	src = cv2.perspectiveTransform(pts, np.linalg.inv(h)).reshape(b_row, b_col, 2)
+	map1, map2 = cv2.convertMaps(src[:,:,0], src[:,:,1], cv2.CV_16SC2)
 
-	return top_left, bordersize, border
+	return _cache_layout(signature, (bs, map1, map2))
+
+def _cache_layout(signature, layout):
+	_layouts[signature] = layout
+	if len(_layouts) > MAX_LAYOUTS:
+		_layouts.popitem(last=False)
+	return layout
+
+def _buffer(buffers, name, shape):
+	"""
+	Function to get the uint8 array called name of the given shape from buffers, allocating
+	it if it isn't there or has another shape. Returns None if buffers is None, so that
+	OpenCV allocates the output.
+	"""
+	if buffers is None:
+		return None
+	if (name not in buffers) or (buffers[name].shape != shape):
+		buffers[name] = np.empty(shape, dtype=np.uint8)
+	return buffers[name]
 
-def undistort_field(image):
+def undistort_field(image, buffers=None):
 	"""
 	Function to undistort the field by turning the trapezoid field image into a rectangle.
 	
 	Input:
 		image: image from the folder 'Pass_Charts'
+		buffers: dict of arrays that are reused for the bordered and undistorted images of
+			charts of the same size, or None to allocate new ones
 	Return:
-		im_out: undistorted image of the field turned into a rectangle
+		im_out: undistorted image of the field turned into a rectangle, which is one of
+			buffers if they are given
 	"""
 
-	tl, bs, border_image = make_grey_border(image)
+	image = read_image(image)
 
-	image = cv2.imread(image)
+	with instrument.timer("get_top"):
+		signature = layout_signature(image)
+	with instrument.timer("get_layout"):
+		layout = get_layout(signature)
+	if layout is None: return None
+	bs, map1, map2 = layout
 
-	i_row, i_col = image.shape[:2]
-	b_row, b_col = border_image.shape[:2]
+	with instrument.timer("remap"):
+		row, col = image.shape[:2]
+		border_image = cv2.copyMakeBorder(image, top=0, bottom=0, 
+			left=bs, right=bs, 
+			borderType= cv2.BORDER_CONSTANT, value=GREY_COLOR,
+			dst=_buffer(buffers, "border", (row, col + 2*bs) + image.shape[2:]))
 
-	if b_col > 1398: return None
-	pts_src = np.array([[0, i_row], [tl+bs, 0], [i_col-tl+bs, 0],[b_col, i_row]])
-	pts_dst = np.array([[0, b_row],[0, 0],[b_col, 0],[b_col, b_row]])
-
-	h, status = cv2.findHomography(pts_src, pts_dst)
-
-	im_out = cv2.warpPerspective(border_image, h, (b_col, b_row)) 
+		im_out = cv2.remap(border_image, map1, map2, cv2.INTER_LINEAR,
+			dst=_buffer(buffers, "undistorted", map1.shape[:2] + image.shape[2:]))
 
 	return im_out
 
+# sideline label boxes of each layout in the undistorted image, as two opposite corners (x, y),
+# keyed by the yards shown in front of the line of scrimmage. An x of None is the right edge
+# of the image (but at least RIGHT_EDGE[layout]).
+RIGHT_EDGE = {70: 1394, 50: 1362}
+
+LABEL_BOXES = {
+	70: [
+		((18,587), (86, 601)), ((1308, 601), (1374,587)),
+		((33, 520), (0, 503)), ((1362, 520), (None, 505)),
+		((33, 440), (0, 421)), ((1362, 440), (None, 423)),
+		((33, 360), (0, 338)), ((1362, 360), (None, 340)),
+		((33, 279), (0, 255)), ((1362, 279), (None, 257)),
+		((33, 200), (0, 173)), ((1362, 200), (None, 175)),
+		((33, 118), (0, 90)), ((1362, 118), (None, 92)),
+		((33, 38), (0, 8)), ((1362, 38), (None, 10)),
+	],
+	50: [
+		((20, 562), (84, 578)), ((1340, 562), (1278, 578)),
+		((33, 476), (0, 455)), ((1331, 476), (None, 457)),
+		((33, 373), (0, 349)), ((1331, 373), (None, 351)),
+		((33, 269), (0, 243)), ((1331, 269), (None, 245)),
+		((33, 165), (0, 137)), ((1331, 165), (None, 139)),
+		((33, 60), (0, 30)), ((1331, 60), (None, 32)),
+	],
+}
+
+# boolean label masks, keyed by (layout, rows, columns)
+_label_masks = {}
+
+def label_mask(layout, shape):
+	"""
+	Function to get the boolean mask of the sideline labels of a layout. The mask is
+	drawn the first time a layout and image size is seen and cached.
+	
+	Input:
+		layout: 50 or 70, the yards shown in front of the line of scrimmage
+		shape: shape of the undistorted image
+	Return:
+		mask: boolean numpy.ndarray of shape[:2], True on the sideline labels
+	"""
+	key = (layout,) + tuple(shape[:2])
+	if key not in _label_masks:
+		mask = np.zeros(shape[:2], dtype=np.uint8)
+		x3 = max(shape[1], RIGHT_EDGE[layout])
+		for ((x0, y0), (x1, y1)) in LABEL_BOXES[layout]:
+			p1 = (x3 if x1 is None else x1, y1)
+			cv2.rectangle(mask, (x0, y0), p1, 1, thickness=-1)
+		_label_masks[key] = mask.astype(bool)
+	return _label_masks[key]
+
+def remove_labels(img, layout):
+	"""
+	Paint the sideline labels of a layout grey, in place.
+	"""
+	img[label_mask(layout, img.shape)] = GREY_COLOR
+	return img
+
 def clean_field_70(image):
 	"""
 	Function that removes the sidelines of an undistorted pass chart field image,
@@ -123,49 +240,7 @@ def clean_field_70(image):
 	Return:
 		img: cleaned undistorted image, without sidelines
 	"""
-	img = Image.open(image)
-	grey_color = (86,96,108)
-	LOS1 = ((18,587), (86, 601))
-	LOS2 = ((1308, 601), (1374,587))
-
-	x0 = 33
-	x1 = 0
-	x2 = 1362
-	x3 = max(img.size[0], 1394)
-
-	l10 = ((x0, 520), (x1, 503))
-	r10 = ((x2, 520), (x3, 505))
-
-	l20 = ((x0, 440), (x1, 421))
-	r20 = ((x2, 440), (x3, 423))
-
-	l30 = ((x0, 360), (x1, 338))
-	r30 = ((x2, 360), (x3, 340))
-
-	l40 = ((x0, 279), (x1, 255))
-	r40 = ((x2, 279), (x3, 257))
-
-	l50 = ((x0, 200), (x1, 173))
-	r50 = ((x2, 200), (x3, 175))
-
-	l60 = ((x0, 118), (x1, 90))
-	r60 = ((x2, 118), (x3, 92))
-
-	l70 = ((x0, 38), (x1, 8))
-	r70 = ((x2, 38), (x3, 10))
-
-	sidelines = [LOS1, LOS2, l10, r10, l20, r20, l30, r30,
-	            l40, r40, l50, r50, l60, r60, l70, r70
-	]
-
-
-
-	draw = ImageDraw.Draw(img)
-
-	for number in sidelines: 
-		draw.rectangle(number, fill=grey_color)
-
-	return img
+	return remove_labels(read_image(image).copy(), 70)
 
 def clean_field_50(image):
 	"""
@@ -177,60 +252,25 @@ def clean_field_50(image):
 	Return:
 		img: cleaned undistorted image, without sidelines
 	"""
-	img = Image.open(image)
-	grey_color = (86,96,108)
-	LOS1 = ((20, 562), (84, 578))
-	LOS2 = ((1340, 562), (1278, 578))
-
-	x0 = 33
-	x1 = 0
-	x2 = 1331
-	x3 = max(img.size[0], 1362)
-
-	l10 = ((x0, 476), (x1, 455))
-	r10 = ((x2, 476), (x3, 457))
-
-	l20 = ((x0, 373), (x1, 349))
-	r20 = ((x2, 373), (x3, 351))
-
-	l30 = ((x0, 269), (x1, 243))
-	r30 = ((x2, 269), (x3, 245))
-
-	l40 = ((x0, 165), (x1, 137))
-	r40 = ((x2, 165), (x3, 139))
-
-	l50 = ((x0, 60), (x1, 30))
-	r50 = ((x2, 60), (x3, 32))
+	return remove_labels(read_image(image).copy(), 50)
 
-	sidelines = [LOS1, LOS2, l10, r10, l20, r20, 
-				l30, r30, l40, r40, l50, r50
-	]
-
-
-
-	draw = ImageDraw.Draw(img)
-
-	for number in sidelines: 
-		draw.rectangle(number, fill=grey_color)
-
-	return img
-
-def clean_field(image):
+def clean_field(image, buffers=None):
 	"""
-	Wrapper function for clean_field_50 and clean_field_70. 
+	Wrapper function for clean_field_50 and clean_field_70. buffers are passed to
+	undistort_field.
 	"""
-	u_img = undistort_field(image)
+	u_img = undistort_field(image, buffers)
 	if u_img is None: 
 		return None
 	row, col = u_img.shape[:2]
 
-	cv2.imwrite(image, u_img)
-
-	if col > 1370:
-		return clean_field_70(image)
+	# u_img is a new image, so the labels are painted over in place
+	with instrument.timer("labels"):
+		if col > 1370:
+			return remove_labels(u_img, 70)
 
-	else:
-		return clean_field_50(image)
+		else:
+			return remove_labels(u_img, 50)
 
 
 
@@ -0,0 +1,162 @@
+"""
+Watch mode for in-season updates: poll the pass chart listing pages of the configured teams,
+seasons and weeks, and stream only the charts that are new or changed through the stages of
+pipeline.py, publishing the pass locations of each chart as soon as it is extracted.
+
+Listing pages and images are requested conditionally with the ETag and Last-Modified of the
+manifest of scrape.py, so an unchanged page costs one 304 response per poll.
+
+The pass locations are published to a delta log, '[deltas]', with one JSON line per extracted
+chart: the key of the chart (the path of its cleaned data), the time it was published, and
+its rows. A chart that changes is published again, and its latest line replaces the earlier
+ones, as read_deltas does.
+
+Usage:
+	python watch.py -s 2019 -w 5 --interval 300
+	python watch.py -t synthetic -s 2000 -w 1 2 3 --base-url http://localhost:8000 --interval 5
+"""
+
+import os
+import json
+import time
+import argparse
+import pandas as pd
+import scrape
+from pipeline import pipeline
+from cache import ResultCache
+
+
+class DeltaPublisher(object):
+	"""
+	Append the pass locations of each extracted chart to a delta log, with the add, flush and
+	done of PassWriter so that it can be the writer of pipeline().
+
+	Input:
+		path: path of the delta log, appended to if it exists
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		# keys of the charts published so far
+		self.done = set()
+		if os.path.exists(path):
+			with open(path) as _file:
+				for line in _file:
+					try:
+						self.done.add(json.loads(line)["chart"])
+					except ValueError:
+						# the last line of an interrupted run
+						continue
+		self._file = open(path, "a")
+
+	def add(self, key, df):
+		"""
+		Publish the rows of one chart.
+		"""
+		self._file.write('{"chart": %s, "time": %.3f, "rows": %s}\n' % (json.dumps(key),
+			time.time(), df.to_json(orient="records")))
+		self._file.flush()
+		self.done.add(key)
+
+	def flush(self):
+		self._file.flush()
+
+	def close(self):
+		self._file.close()
+
+
+def read_deltas(path, since=0.0):
+	"""
+	Function to read the latest pass locations of every chart in a delta log.
+
+	Input:
+		path: path of the delta log
+		since: only charts published after this time, in seconds since the epoch
+	Return:
+		df: Pandas DataFrame of the pass locations, with the chart and time they were published
+	"""
+	latest = {}
+	with open(path) as _file:
+		for line in _file:
+			try:
+				delta = json.loads(line)
+			except ValueError:
+				continue
+			if delta["time"] > since:
+				latest[delta["chart"]] = delta
+
+	frames = []
+	for delta in latest.values():
+		df = pd.DataFrame(delta["rows"])
+		df.insert(0, "chart", delta["chart"])
+		df.insert(1, "time", delta["time"])
+		frames.append(df)
+	if len(frames) == 0:
+		return pd.DataFrame(columns = ["chart", "time"])
+	return pd.concat(frames, ignore_index=True)
+
+def watch(teams, seasons, weeks, interval=300, cycles=None, deltas="pass_deltas.jsonl", **kw):
+	"""
+	Function to poll the listing pages of teams in seasons and weeks every interval seconds,
+	and publish the pass locations of new and changed charts to the delta log.
+
+	Input:
+		teams, seasons, weeks: lists of teams, seasons and weeks to watch
+		interval: seconds from the start of one poll to the start of the next
+		cycles: number of polls, or None to poll until interrupted
+		deltas: path of the delta log
+		kw: other arguments of pipeline(), e.g. base_url, the worker counts, or cache
+	Return:
+		n_charts: number of charts published
+	"""
+	publisher = DeltaPublisher(deltas)
+	n_charts = 0
+	cycle = 0
+	try:
+		while (cycles is None) or (cycle < cycles):
+			start = time.time()
+			n = pipeline(teams, seasons, weeks, incremental=True, writer=publisher, **kw)
+			n_charts += n
+			cycle += 1
+			print(time.strftime("%H:%M:%S"), "poll", cycle, ":", n, "charts published")
+			if (cycles is None) or (cycle < cycles):
+				time.sleep(max(0.0, interval - (time.time() - start)))
+	except KeyboardInterrupt:
+		pass
+	finally:
+		publisher.close()
+	return n_charts
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Poll Next Gen Stats and publish the pass locations of new charts')
+	parser.add_argument('-s', '--seasons', nargs='+', type=str, dest='seasons', default=scrape.seasons, help='input season')
+	parser.add_argument('-t', '--teams', nargs='+', type=str, dest='teams', default=scrape.teams, help='input team')
+	parser.add_argument('-w', '--weeks', nargs='+', type=str, dest='weeks', required=True, help='input week')
+	parser.add_argument('-i', '--interval', type=float, dest='interval', default=300,
+		help='seconds between polls')
+	parser.add_argument('-n', '--cycles', type=int, dest='cycles', default=None,
+		help='number of polls, by default until interrupted')
+	parser.add_argument('--deltas', type=str, dest='deltas', default="pass_deltas.jsonl",
+		help='delta log the pass locations of every chart are published to')
+	parser.add_argument('--download-workers', type=int, dest='download_workers', default=8,
+		help='number of images downloading at once')
+	parser.add_argument('--extract-workers', type=int, dest='extract_workers', default=1,
+		help='number of worker processes extracting pass locations')
+	parser.add_argument('-r', '--rate', type=float, dest='rate', default=None,
+		help='maximum requests per second')
+	parser.add_argument('--base-url', type=str, dest='base_url', default=scrape.base_url,
+		help='root URL to poll, e.g. a local fixture server')
+	parser.add_argument('--cache', type=str, dest='cache', default="Extraction_Cache",
+		help='folder of the cache of extracted pass locations')
+	parser.add_argument('--no-cache', action='store_const', const=None, dest='cache',
+		help='extract every chart, without reading or writing the cache')
+	args = parser.parse_args()
+
+	cache = ResultCache(args.cache) if args.cache else None
+
+	print("Watching", len(args.teams), "teams,", len(args.weeks), "weeks...")
+	n_charts = watch(args.teams, args.seasons, args.weeks, args.interval, args.cycles, args.deltas,
+		download_workers=args.download_workers, extract_workers=args.extract_workers,
+		rate=args.rate, base_url=args.base_url, cache=cache)
+	print(n_charts, "charts published to", args.deltas)